@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from sqladmin import Admin
-from .views import UserView, UserStatsView, VideoStatsView
+from .views import UserView, UserStatsView, VideoView, VideoStatsView
 from .auth import authentication_backend
 from app.db.base import engine
 
@@ -10,5 +10,6 @@ def attach_admin_panel(application: FastAPI):
 
     admin.add_view(UserView)
     admin.add_view(UserStatsView)
+    admin.add_view(VideoView)
     admin.add_view(VideoStatsView)
 
@@ -1,4 +1,4 @@
-from app.db.tables import User, UserStats, VideoStats
+from app.db.tables import User, UserStats, Video, VideoStats
 from sqladmin import ModelView
 
 
@@ -14,8 +14,13 @@ class UserStatsView(ModelView, model=UserStats):
     column_default_sort = [(UserStats.created_at, True)]
 
 
+class VideoView(ModelView, model=Video):
+    column_list = "__all__"
+    column_searchable_list = [Video.nickname, Video.video_id]
+    column_default_sort = [(Video.id, True)]
+
+
 class VideoStatsView(ModelView, model=VideoStats):
     column_list = "__all__"
-    column_searchable_list = [VideoStats.nickname]
     column_default_sort = [(VideoStats.created_at, True)]
 
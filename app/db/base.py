@@ -7,6 +7,7 @@ from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import sessionmaker
 
 from app.db.create import settings
+from app.db.replicas import RoutingSession
 
 DATABASE_URL = f'postgresql+asyncpg://' \
                f'{settings.postgres_user}:{settings.postgres_password}' \
@@ -14,9 +15,24 @@ DATABASE_URL = f'postgresql+asyncpg://' \
 
 engine = create_async_engine(
     DATABASE_URL,
-    pool_size=20,
+    pool_size=settings.postgres_pool_size,
     max_overflow=0,
+    pool_timeout=settings.postgres_pool_timeout,
     pool_reset_on_return=True,
+    connect_args={"server_settings": {"application_name": "api"}},
+)
+
+ingest_server_settings = {"application_name": "ingest"}
+if settings.postgres_ingest_statement_timeout_ms:
+    ingest_server_settings["statement_timeout"] = str(settings.postgres_ingest_statement_timeout_ms)
+
+ingest_engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=settings.postgres_ingest_pool_size,
+    max_overflow=0,
+    pool_timeout=settings.postgres_ingest_pool_timeout,
+    pool_reset_on_return=True,
+    connect_args={"server_settings": ingest_server_settings},
 )
 
 
@@ -26,6 +42,15 @@ class Base(DeclarativeBase):
 
 async_session = sessionmaker(
     engine, class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
+    autoflush=True,
+    autocommit=False,
+)
+
+# Background ingestion reads what it just wrote, it never goes to a replica
+ingest_session = sessionmaker(
+    ingest_engine, class_=AsyncSession,
     expire_on_commit=False,
     autoflush=True,
     autocommit=False,
@@ -46,3 +71,8 @@ def run_init_models():
 async def get_session():
     async with async_session() as session:
         yield session
+
+
+async def get_ingest_session():
+    async with ingest_session() as session:
+        yield session
@@ -10,6 +10,16 @@ class Settings(BaseSettings):
     postgres_db: str = 'db'
     postgres_password: str = 'postgres'
     postgres_user: str = 'postgres'
+    # Connections for API requests
+    postgres_pool_size: int = 20
+    # Seconds a request waits for a free connection before failing
+    postgres_pool_timeout: float = 10
+    # Connections for refreshes, maintenance and media mirroring, kept apart
+    # so a running refresh never takes connections from the API
+    postgres_ingest_pool_size: int = 5
+    postgres_ingest_pool_timeout: float = 300
+    # Bounds a single ingestion statement, 0 disables it
+    postgres_ingest_statement_timeout_ms: int = 0
 
 
 settings = Settings()
@@ -0,0 +1,46 @@
+"""add trend snapshots
+
+Revision ID: 5e1c3b8a9d20
+Revises: 317b20a4f1fb
+Create Date: 2026-10-18 10:12:41.503112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1c3b8a9d20'
+down_revision = '317b20a4f1fb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('trend_snapshots',
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text("(now() at time zone 'utc')"), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_trend_snapshots_id'), 'trend_snapshots', ['id'], unique=False)
+    for table in ('trend_videos', 'trend_hashtags', 'trend_songs'):
+        op.add_column(table, sa.Column('snapshot_id', sa.Integer(), nullable=True))
+        op.create_index(op.f(f'ix_{table}_snapshot_id'), table, ['snapshot_id'], unique=False)
+        op.create_foreign_key(None, table, 'trend_snapshots', ['snapshot_id'], ['id'], ondelete='CASCADE')
+
+    # Keep serving the existing trends as the first live snapshot
+    op.execute("INSERT INTO trend_snapshots (id, finished_at) VALUES (1, now() at time zone 'utc')")
+    op.execute("SELECT setval('trend_snapshots_id_seq', 1)")
+    for table in ('trend_videos', 'trend_hashtags', 'trend_songs'):
+        op.execute(f"UPDATE {table} SET snapshot_id = 1")
+
+
+def downgrade() -> None:
+    for table in ('trend_songs', 'trend_hashtags', 'trend_videos'):
+        op.drop_constraint(f'{table}_snapshot_id_fkey', table, type_='foreignkey')
+        op.drop_index(op.f(f'ix_{table}_snapshot_id'), table_name=table)
+        op.drop_column(table, 'snapshot_id')
+    op.drop_index(op.f('ix_trend_snapshots_id'), table_name='trend_snapshots')
+    op.drop_table('trend_snapshots')
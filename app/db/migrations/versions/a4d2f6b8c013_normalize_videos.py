@@ -0,0 +1,147 @@
+"""normalize videos
+
+Revision ID: a4d2f6b8c013
+Revises: 7b3e1a9c5d24
+Create Date: 2026-10-18 22:14:37.880215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d2f6b8c013'
+down_revision = '7b3e1a9c5d24'
+branch_labels = None
+depends_on = None
+
+
+WIDE_COLUMNS = (
+    'video_id VARCHAR NOT NULL, views BIGINT NOT NULL, comments BIGINT NOT NULL, diggs BIGINT NOT NULL, '
+    'shares BIGINT NOT NULL, nickname VARCHAR NOT NULL, cover_url VARCHAR NOT NULL, video_url VARCHAR NOT NULL, '
+    'run_id INTEGER, created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, id INTEGER NOT NULL, '
+    'updated_at TIMESTAMP WITHOUT TIME ZONE'
+)
+NARROW_COLUMNS = (
+    'video_key INTEGER NOT NULL, views BIGINT NOT NULL, comments BIGINT NOT NULL, diggs BIGINT NOT NULL, '
+    'shares BIGINT NOT NULL, run_id INTEGER, created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, id INTEGER NOT NULL, '
+    'updated_at TIMESTAMP WITHOUT TIME ZONE'
+)
+NARROW_SELECT = (
+    'SELECT v.id, s.views, s.comments, s.diggs, s.shares, s.run_id, s.created_at, s.id, s.updated_at '
+    'FROM {source} s JOIN videos v ON v.video_id = s.video_id'
+)
+NARROW_INSERT = 'INSERT INTO {target} (video_key, views, comments, diggs, shares, run_id, created_at, id, updated_at) '
+WIDE_SELECT = (
+    'SELECT v.video_id, s.views, s.comments, s.diggs, s.shares, v.nickname, v.cover_url, v.video_url, '
+    's.run_id, s.created_at, s.id, s.updated_at FROM {source} s JOIN videos v ON v.id = s.video_key'
+)
+WIDE_INSERT = (
+    'INSERT INTO {target} (video_id, views, comments, diggs, shares, nickname, cover_url, video_url, '
+    'run_id, created_at, id, updated_at) '
+)
+VIDEOS_BACKFILL = (
+    'INSERT INTO videos (video_id, nickname, cover_url, video_url, first_seen_at) '
+    'SELECT video_id, (array_agg(nickname ORDER BY created_at DESC))[1], '
+    '(array_agg(cover_url ORDER BY created_at DESC))[1], (array_agg(video_url ORDER BY created_at DESC))[1], '
+    'min(created_at) FROM video_statss {where} GROUP BY video_id ON CONFLICT (video_id) DO NOTHING'
+)
+
+
+def get_partitions(table: str) -> list[tuple[str, str]]:
+    return op.get_bind().execute(sa.text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = CAST(:table AS regclass)"
+    ), {"table": table}).fetchall()
+
+
+def rebuild(columns: str, insert: str, select: str, indexes: list[tuple[str, str]], prepare=None):
+    # video_statss is rebuilt into video_statss_new with the same partitions.
+    # Rows up to the current max id are copied one partition per transaction
+    # while the app keeps writing. Only the rows that arrived since then are
+    # copied under an EXCLUSIVE lock, which still lets readers through. The
+    # two tables are swapped in the same transaction.
+    partitions = get_partitions('video_statss')
+    high = op.get_bind().execute(sa.text('SELECT coalesce(max(id), 0) FROM video_statss')).scalar()
+    if prepare is not None:
+        prepare(f'WHERE id <= {high}')
+
+    op.execute(f'CREATE TABLE video_statss_new ({columns}) PARTITION BY RANGE (created_at)')
+    for name, bound in partitions:
+        op.execute(f'CREATE TABLE {name}_new PARTITION OF video_statss_new {bound}')
+    with op.get_context().autocommit_block():
+        for name, bound in partitions:
+            op.execute(insert.format(target='video_statss_new') + select.format(source=name) + f' WHERE s.id <= {high}')
+
+    op.execute("ALTER TABLE video_statss_new ALTER COLUMN id SET DEFAULT nextval('video_statss_id_seq')")
+    op.execute("ALTER TABLE video_statss_new ALTER COLUMN created_at SET DEFAULT (now() at time zone 'utc')")
+    op.execute('ALTER TABLE video_statss_new ADD CONSTRAINT video_statss_new_pkey PRIMARY KEY (id, created_at)')
+    for name, definition in indexes:
+        op.execute(f'CREATE INDEX {name}_new ON video_statss_new {definition}')
+
+    op.execute('LOCK TABLE video_statss IN EXCLUSIVE MODE')
+    if prepare is not None:
+        prepare(f'WHERE id > {high}')
+    op.execute(insert.format(target='video_statss_new') + select.format(source='video_statss') + f' WHERE s.id > {high}')
+    op.execute('ALTER SEQUENCE video_statss_id_seq OWNED BY video_statss_new.id')
+    op.execute('DROP TABLE video_statss')
+
+    op.execute('ALTER TABLE video_statss_new RENAME TO video_statss')
+    op.execute('ALTER INDEX video_statss_new_pkey RENAME TO video_statss_pkey')
+    for name, definition in indexes:
+        op.execute(f'ALTER INDEX {name}_new RENAME TO {name}')
+    for name, bound in partitions:
+        op.execute(f'ALTER TABLE {name}_new RENAME TO {name}')
+    op.create_foreign_key('video_statss_run_id_fkey', 'video_statss', 'scrape_runs', ['run_id'], ['id'], ondelete='CASCADE')
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('videos',
+    sa.Column('video_id', sa.String(), nullable=False),
+    sa.Column('nickname', sa.String(), nullable=False),
+    sa.Column('cover_url', sa.String(), nullable=False),
+    sa.Column('video_url', sa.String(), nullable=False),
+    sa.Column('first_seen_at', sa.DateTime(), server_default=sa.text("(now() at time zone 'utc')"), nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text("(now() at time zone 'utc')"), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['nickname'], ['users.nickname'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('video_id')
+    )
+    op.create_index(op.f('ix_videos_id'), 'videos', ['id'], unique=False)
+    op.create_index(op.f('ix_videos_nickname'), 'videos', ['nickname'], unique=False)
+    # ### end Alembic commands ###
+
+    def backfill_videos(where: str):
+        op.execute(VIDEOS_BACKFILL.format(where=where))
+
+    rebuild(
+        NARROW_COLUMNS, NARROW_INSERT, NARROW_SELECT,
+        [
+            ('ix_video_statss_video_key_created_at', '(video_key, created_at)'),
+            ('ix_video_statss_run_id', '(run_id)'),
+            ('ix_video_statss_id', '(id)'),
+        ],
+        prepare=backfill_videos,
+    )
+    op.create_foreign_key('video_statss_video_key_fkey', 'video_statss', 'videos', ['video_key'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    rebuild(
+        WIDE_COLUMNS, WIDE_INSERT, WIDE_SELECT,
+        [
+            ('ix_video_statss_nickname_created_at', '(nickname, created_at)'),
+            ('ix_video_statss_nickname_video_id_created_at', '(nickname, video_id, created_at)'),
+            ('ix_video_statss_run_id', '(run_id)'),
+            ('ix_video_statss_id', '(id)'),
+        ],
+    )
+    op.create_foreign_key('video_statss_nickname_fkey', 'video_statss', 'users', ['nickname'], ['nickname'], ondelete='CASCADE')
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index(op.f('ix_videos_nickname'), table_name='videos')
+    op.drop_index(op.f('ix_videos_id'), table_name='videos')
+    op.drop_table('videos')
+    # ### end Alembic commands ###
@@ -0,0 +1,37 @@
+"""add stats read indexes
+
+Revision ID: e6b9d1f3a4c8
+Revises: d41f08b27c55
+Create Date: 2026-10-18 16:21:48.092651
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b9d1f3a4c8'
+down_revision = 'd41f08b27c55'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_user_statss_nickname_created_at', 'user_statss', ['nickname', 'created_at']),
+    ('ix_video_statss_nickname_created_at', 'video_statss', ['nickname', 'created_at']),
+    ('ix_video_statss_nickname_video_id_created_at', 'video_statss', ['nickname', 'video_id', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY can not run inside a transaction, but does not lock writes
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')  # leftover of an interrupted build
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,97 @@
+"""partition stats tables
+
+Revision ID: f2a8c5d71e94
+Revises: e6b9d1f3a4c8
+Create Date: 2026-10-18 17:05:31.448270
+
+"""
+import datetime as dt
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8c5d71e94'
+down_revision = 'e6b9d1f3a4c8'
+branch_labels = None
+depends_on = None
+
+
+TABLES = {
+    'user_statss': [
+        ('ix_user_statss_id', ['id']),
+        ('ix_user_statss_nickname_created_at', ['nickname', 'created_at']),
+    ],
+    'video_statss': [
+        ('ix_video_statss_id', ['id']),
+        ('ix_video_statss_nickname_created_at', ['nickname', 'created_at']),
+        ('ix_video_statss_nickname_video_id_created_at', ['nickname', 'video_id', 'created_at']),
+    ],
+}
+PARTITIONS_AHEAD = 3
+
+
+def month_start(value: dt.datetime, months: int = 0) -> dt.datetime:
+    month = value.year * 12 + value.month - 1 + months
+    return dt.datetime(month // 12, month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    # The existing table is attached as one partition holding the whole history
+    # up to next month, so no rows are copied. The unique index and the CHECK
+    # constraint are prepared without blocking writes, which makes the attach
+    # itself a catalog-only change.
+    bound = month_start(dt.datetime.now(), 1)
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {table}_legacy_id_created_at')
+            op.execute(f'CREATE UNIQUE INDEX CONCURRENTLY {table}_legacy_id_created_at ON {table} (id, created_at)')
+            op.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_legacy_bound')
+            op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_legacy_bound CHECK (created_at < '{bound.isoformat()}') NOT VALID")
+            op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {table}_legacy_bound')
+
+    for table, indexes in TABLES.items():
+        op.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+        op.execute(f'ALTER TABLE {table}_legacy DROP CONSTRAINT {table}_pkey')
+        for name, columns in indexes:
+            op.execute(f'ALTER INDEX {name} RENAME TO {name}_legacy')
+
+        op.execute(f'CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)')
+        op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+        op.create_primary_key(f'{table}_pkey', table, ['id', 'created_at'])
+        op.create_foreign_key(f'{table}_nickname_fkey', table, 'users', ['nickname'], ['nickname'], ondelete='CASCADE')
+        for name, columns in indexes:
+            op.create_index(name, table, columns, unique=False)
+
+        op.execute(f"ALTER TABLE {table} ATTACH PARTITION {table}_legacy FOR VALUES FROM (MINVALUE) TO ('{bound.isoformat()}')")
+        op.execute(f'ALTER TABLE {table}_legacy DROP CONSTRAINT {table}_legacy_bound')
+
+        start = bound
+        for _ in range(PARTITIONS_AHEAD):
+            end = month_start(start, 1)
+            op.execute(
+                f"CREATE TABLE {table}_p{start:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+            start = end
+
+
+def downgrade() -> None:
+    # Copies the rows back into a plain table, partitions detached by the
+    # retention policy are left untouched
+    for table, indexes in TABLES.items():
+        op.execute(f'ALTER TABLE {table} RENAME TO {table}_partitioned')
+        op.execute(f'ALTER INDEX {table}_pkey RENAME TO {table}_partitioned_pkey')
+        for name, columns in indexes:
+            op.execute(f'ALTER INDEX {name} RENAME TO {name}_partitioned')
+
+        op.execute(f'CREATE TABLE {table} (LIKE {table}_partitioned INCLUDING DEFAULTS)')
+        op.execute(f'INSERT INTO {table} SELECT * FROM {table}_partitioned')
+        op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+        op.execute(f'DROP TABLE {table}_partitioned')
+
+        op.create_primary_key(f'{table}_pkey', table, ['id'])
+        op.create_foreign_key(f'{table}_nickname_fkey', table, 'users', ['nickname'], ['nickname'], ondelete='CASCADE')
+        for name, columns in indexes:
+            op.create_index(name, table, columns, unique=False)
@@ -9,7 +9,7 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
-pool = ConnectionPool.from_url(f'redis://{settings.redis_host}:{settings.redis_port}/{settings.redis_db}', max_connections=20)
+pool = ConnectionPool.from_url(f'redis://{settings.redis_host}:{settings.redis_port}/{settings.redis_db}', max_connections=20, decode_responses=True)
 
 
 def get_redis_session():
@@ -6,10 +6,14 @@ from enum import Enum
 from sqlalchemy import BIGINT, bindparam
 from sqlalchemy import CheckConstraint
 from sqlalchemy import Column
+from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Table
 from sqlalchemy import text
 from sqlalchemy import UniqueConstraint
+from sqlalchemy import String
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import Mapped as M
@@ -44,33 +48,181 @@ class User(BaseMixin, Base):
     error: M[str | None] = column(nullable=True)
 
     stats: M[list['UserStats']] = relationship(back_populates="user", lazy='noload', cascade='all, delete')
-    video_stats: M[list['VideoStats']] = relationship(back_populates="user", lazy='noload', cascade='all, delete')
+    videos: M[list['Video']] = relationship(back_populates="user", lazy='noload', cascade='all, delete')
     __table_args__ = (
         UniqueConstraint('app_id', 'nickname', name='uix_externalid_appbundle'),
     )
 
 
+class ScrapeRun(BaseMixin, Base):
+    # One ingestion run, snapshot and trend rows point at the run that wrote them
+    kind: M[str]
+    actor: M[str]
+    status: M[str] = column(default='running')
+    started_at: M[dt.datetime]
+    finished_at: M[dt.datetime | None] = column(nullable=True)
+    requested: M[int] = column(default=0)
+    fetched_rows: M[int] = column(default=0)
+    user_rows: M[int] = column(default=0)
+    video_rows: M[int] = column(default=0)
+    # Time spent writing to the database, the rest of the run is spent waiting on the actor
+    store_seconds: M[float] = column(default=0)
+    error: M[str | None] = column(nullable=True)
+
+    __table_args__ = (
+        Index('ix_scrape_runs_kind_id_finished', 'kind', 'id', postgresql_where=text("status = 'finished'")),
+    )
+
+
 class UserStats(BaseMixin, Base):
     followers: M[int] = column(type_=BIGINT)
     following: M[int] = column(type_=BIGINT)
     likes: M[int] = column(type_=BIGINT)
     diggs: M[int] = column(type_=BIGINT)
     nickname: M[str] = column(ForeignKey('users.nickname', ondelete="CASCADE"))
+    # Videos shown in this snapshot, their rows may come from earlier snapshots
+    video_ids: M[list[str] | None] = column(ARRAY(String), nullable=True)
+    run_id: M[int | None] = column(ForeignKey('scrape_runs.id', ondelete="CASCADE"), nullable=True)
+    # Range partitioned by month, the partition key has to be part of the primary key
+    created_at: M[dt.datetime] = column(primary_key=True, server_default=sql_utcnow)
 
     user: M['User'] = relationship(back_populates='stats', lazy='noload')
+    __table_args__ = (
+        Index('ix_user_statss_nickname_created_at', 'nickname', 'created_at'),
+        Index('ix_user_statss_run_id', 'run_id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+
+class Video(BaseMixin, Base):
+    # Everything about a video that does not change between snapshots
+    video_id: M[str] = column(unique=True)
+    nickname: M[str] = column(ForeignKey('users.nickname', ondelete="CASCADE"), index=True)
+    cover_url: M[str]
+    video_url: M[str]
+    first_seen_at: M[dt.datetime] = column(server_default=sql_utcnow)
+
+    user: M['User'] = relationship(back_populates='videos', lazy='noload')
+    stats: M[list['VideoStats']] = relationship(back_populates='video', lazy='noload', cascade='all, delete')
 
 
 class VideoStats(BaseMixin, Base):
-    video_id: M[str]
+    # Narrow fact table, the video itself lives in videos
+    video_key: M[int] = column(ForeignKey('videos.id', ondelete="CASCADE"))
     views: M[int] = column(type_=BIGINT)
     comments: M[int] = column(type_=BIGINT)
     diggs: M[int] = column(type_=BIGINT)
     shares: M[int] = column(type_=BIGINT)
+    run_id: M[int | None] = column(ForeignKey('scrape_runs.id', ondelete="CASCADE"), nullable=True)
+    created_at: M[dt.datetime] = column(primary_key=True, server_default=sql_utcnow)
+
+    video: M['Video'] = relationship(back_populates='stats', lazy='noload')
+    __table_args__ = (
+        Index('ix_video_statss_video_key_created_at', 'video_key', 'created_at'),
+        Index('ix_video_statss_run_id', 'run_id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+
+class VideoStatsArchive(BaseMixin, Base):
+    # Cold video_statss rows of one video and month packed into arrays, index i of every array is one snapshot
+    video_key: M[int] = column(ForeignKey('videos.id', ondelete="CASCADE"))
+    period_start: M[dt.datetime]
+    period_end: M[dt.datetime]
+    created_ats: M[list[dt.datetime]] = column(ARRAY(DateTime))
+    views: M[list[int]] = column(ARRAY(BIGINT))
+    comments: M[list[int]] = column(ARRAY(BIGINT))
+    diggs: M[list[int]] = column(ARRAY(BIGINT))
+    shares: M[list[int]] = column(ARRAY(BIGINT))
+
+    __table_args__ = (
+        UniqueConstraint('video_key', 'period_start', name='uix_video_stats_archives_video_key_period_start'),
+        Index('ix_video_stats_archives_period_end', 'period_end'),
+    )
+
+
+class LatestStats(Base):
+    # Current snapshot of every user (video_id '') and of their current videos, upserted on ingest
+    __tablename__ = 'latest_stats'
+
+    nickname: M[str] = column(ForeignKey('users.nickname', ondelete="CASCADE"), primary_key=True)
+    video_id: M[str] = column(primary_key=True, server_default='')
+    followers: M[int | None] = column(type_=BIGINT, nullable=True)
+    following: M[int | None] = column(type_=BIGINT, nullable=True)
+    likes: M[int | None] = column(type_=BIGINT, nullable=True)
+    diggs: M[int] = column(type_=BIGINT)
+    views: M[int | None] = column(type_=BIGINT, nullable=True)
+    comments: M[int | None] = column(type_=BIGINT, nullable=True)
+    shares: M[int | None] = column(type_=BIGINT, nullable=True)
+    cover_url: M[str | None] = column(nullable=True)
+    video_url: M[str | None] = column(nullable=True)
+    # Time of the snapshot the row comes from
+    created_at: M[dt.datetime]
+    updated_at: M[dt.datetime | None] = column(nullable=True, onupdate=sql_utcnow)
+
+
+class DailyUserStats(BaseMixin, Base):
+    # Per-day rollup of user_statss maintained on ingest, growth reads never touch raw snapshots
+    nickname: M[str] = column(ForeignKey('users.nickname', ondelete="CASCADE"))
+    day: M[dt.date]
+    first_at: M[dt.datetime]
+    last_at: M[dt.datetime]
+    first_followers: M[int] = column(type_=BIGINT)
+    last_followers: M[int] = column(type_=BIGINT)
+    min_followers: M[int] = column(type_=BIGINT)
+    max_followers: M[int] = column(type_=BIGINT)
+    first_following: M[int] = column(type_=BIGINT)
+    last_following: M[int] = column(type_=BIGINT)
+    min_following: M[int] = column(type_=BIGINT)
+    max_following: M[int] = column(type_=BIGINT)
+    first_likes: M[int] = column(type_=BIGINT)
+    last_likes: M[int] = column(type_=BIGINT)
+    min_likes: M[int] = column(type_=BIGINT)
+    max_likes: M[int] = column(type_=BIGINT)
+    first_diggs: M[int] = column(type_=BIGINT)
+    last_diggs: M[int] = column(type_=BIGINT)
+    min_diggs: M[int] = column(type_=BIGINT)
+    max_diggs: M[int] = column(type_=BIGINT)
+
+    __table_args__ = (
+        UniqueConstraint('nickname', 'day', name='uix_daily_user_statss_nickname_day'),
+    )
+
+
+class DailyVideoStats(BaseMixin, Base):
+    # Days where the counters of a video did not change have no row, like video_statss
+    video_id: M[str]
     nickname: M[str] = column(ForeignKey('users.nickname', ondelete="CASCADE"))
+    day: M[dt.date]
     cover_url: M[str]
     video_url: M[str]
+    first_at: M[dt.datetime]
+    last_at: M[dt.datetime]
+    first_views: M[int] = column(type_=BIGINT)
+    last_views: M[int] = column(type_=BIGINT)
+    min_views: M[int] = column(type_=BIGINT)
+    max_views: M[int] = column(type_=BIGINT)
+    first_comments: M[int] = column(type_=BIGINT)
+    last_comments: M[int] = column(type_=BIGINT)
+    min_comments: M[int] = column(type_=BIGINT)
+    max_comments: M[int] = column(type_=BIGINT)
+    first_diggs: M[int] = column(type_=BIGINT)
+    last_diggs: M[int] = column(type_=BIGINT)
+    min_diggs: M[int] = column(type_=BIGINT)
+    max_diggs: M[int] = column(type_=BIGINT)
+    first_shares: M[int] = column(type_=BIGINT)
+    last_shares: M[int] = column(type_=BIGINT)
+    min_shares: M[int] = column(type_=BIGINT)
+    max_shares: M[int] = column(type_=BIGINT)
+
+    __table_args__ = (
+        UniqueConstraint('nickname', 'video_id', 'day', name='uix_daily_video_statss_nickname_video_id_day'),
+    )
 
-    user: M['User'] = relationship(back_populates='video_stats', lazy='noload')
+
+class TrendSnapshot(BaseMixin, Base):
+    # The newest finished snapshot is the one served by the trend endpoints
+    finished_at: M[dt.datetime | None] = column(nullable=True)
 
 
 class TrendVideo(BaseMixin, Base):
@@ -78,11 +230,15 @@ class TrendVideo(BaseMixin, Base):
     views: M[int] = column(type_=BIGINT)
     description: M[str]
     video_url: M[str]
+    snapshot_id: M[int | None] = column(ForeignKey('trend_snapshots.id', ondelete="CASCADE"), index=True, nullable=True)
+    run_id: M[int | None] = column(ForeignKey('scrape_runs.id', ondelete="CASCADE"), index=True, nullable=True)
 
 
 class TrendHashtag(BaseMixin, Base):
     name: M[str]
     views: M[int] = column(type_=BIGINT)
+    snapshot_id: M[int | None] = column(ForeignKey('trend_snapshots.id', ondelete="CASCADE"), index=True, nullable=True)
+    run_id: M[int | None] = column(ForeignKey('scrape_runs.id', ondelete="CASCADE"), index=True, nullable=True)
 
 
 class TrendSong(BaseMixin, Base):
@@ -90,4 +246,14 @@ class TrendSong(BaseMixin, Base):
     song_url: M[str]
     title: M[str]
     author: M[str]
+    snapshot_id: M[int | None] = column(ForeignKey('trend_snapshots.id', ondelete="CASCADE"), index=True, nullable=True)
+    run_id: M[int | None] = column(ForeignKey('scrape_runs.id', ondelete="CASCADE"), index=True, nullable=True)
+
 
+class MediaObject(BaseMixin, Base):
+    # Remote media url mirrored into the local content-addressed store
+    source_url_hash: M[str] = column(index=True, unique=True)
+    source_url: M[str]
+    sha256: M[str] = column(index=True)
+    content_type: M[str]
+    size: M[int] = column(type_=BIGINT)
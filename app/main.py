@@ -5,11 +5,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic_settings import BaseSettings
 from loguru import logger
-from fastapi_utils.tasks import repeat_every
 from contextlib import asynccontextmanager
 
 from app.db.admin import attach_admin_panel
-from app.services.stats import StatsService
+from app.db.replicas import replicas, read_your_writes
+from app.repositories.external import ApifyClient
+from app.services.batcher import stats_load_batcher
 
 
 class ProjectSettings(BaseSettings):
@@ -40,18 +41,15 @@ def register_cors(application):
     )
 
 
-@repeat_every(seconds=12 * 60 * 60)
-async def update_user_stats():
-    try:
-        await StatsService.update_stats()
-    except Exception as e:
-        logger.exception(e)
-
-
 @asynccontextmanager
 async def lifespan(app):
-    await update_user_stats()
+    await ApifyClient.open()
+    # Refreshes and maintenance run in app.scheduler, startup does no scraping
+    await replicas.start()
     yield
+    await stats_load_batcher.close()
+    await ApifyClient.close()
+    await replicas.stop()
 
 
 def init_web_application():
@@ -66,12 +64,15 @@ def init_web_application():
     if project_settings.LOCAL_MODE:
         register_exception(application)
         register_cors(application)
+    application.middleware("http")(read_your_writes)
 
     from app.routes.user import router as user_router
     from app.routes.stats import router as stats_router
+    from app.routes.media import router as media_router
 
     application.include_router(user_router)
     application.include_router(stats_router)
+    application.include_router(media_router)
 
     attach_admin_panel(application)
 
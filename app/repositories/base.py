@@ -19,7 +19,7 @@ from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.attributes import InstrumentedAttribute as TableAttr
 
 from app.db.base import Base as BaseTable
-from app.db.base import get_session
+from app.db.base import get_session, get_ingest_session
 
 
 class TableAttributeWithSubqueryLoad(TypedDict):
@@ -245,7 +245,8 @@ class BaseRepository[Table: BaseTable]:
 
     async def __aenter__(self) -> Self:
         if self.session is None:
-            self._session_creator = get_session()
+            # Repositories opened outside of a request do background work
+            self._session_creator = get_ingest_session()
             self.session = await anext(self._session_creator)
             self._commit_and_close = True
         return self
@@ -1,81 +1,465 @@
-from aiohttp import ClientSession
+from aiohttp import ClientResponse, ClientResponseError, ClientSession, ClientTimeout, TCPConnector
+from contextlib import asynccontextmanager
+from pydantic_settings import BaseSettings
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable
+import asyncio
+import time
 import os
 import json
 from loguru import logger
 
-from app.schemas.external import ExternalDataSchema, ExternalTrendSongDataSchema, ExternalVideoDataSchema
+from app.schemas.external import ExternalTrendSongDataSchema
 from app.schemas.external import ExternalTrendHashtagDataSchema, ExternalTrendVideoDataSchema
+from app.schemas.external import ExternalVideoStatsRow, ExternalVideoStatsRows
+
+
+
+class ApifyClientSettings(BaseSettings):
+    apify_connection_limit: int = 100
+    apify_connection_limit_per_host: int = 20
+    apify_dns_cache_ttl: int = 300
+    apify_keepalive_timeout: float = 60
+    apify_connect_timeout: float = 10
+    apify_read_timeout: float = 600
+    apify_total_timeout: float = 900
+    # {"actor~name": {"connect": 5, "read": 120, "total": 300}}
+    apify_actor_timeouts: dict[str, dict[str, float]] = {}
+    apify_concurrency_initial: int = 4
+    apify_concurrency_min: int = 1
+    apify_concurrency_max: int = 32
+    # A call slower than this many times the average latency counts as unhealthy
+    apify_latency_tolerance: float = 2
+
+
+class AdaptiveLimiter:
+    # AIMD concurrency limit: grows by about one slot per window of healthy
+    # calls and is halved on 429, 5xx or timeouts
+
+    def __init__(
+            self,
+            initial: int,
+            minimum: int,
+            maximum: int,
+            latency_tolerance: float,
+            decrease_factor: float = 0.5,
+            latency_smoothing: float = 0.2,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.latency_smoothing = latency_smoothing
+        self.average_latency: float | None = None
+        self.in_flight = 0
+        self.waiting = 0
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "average_latency": self.average_latency,
+        }
+
+    async def acquire(self):
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    async def release(self, healthy: bool | None, latency: float):
+        async with self._condition:
+            self.in_flight -= 1
+            if healthy is False:
+                # Calls started before the last decrease belong to the same
+                # congestion event, a burst of 429s halves the limit once
+                now = time.monotonic()
+                if now - latency >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                    logger.warning(f"Apify concurrency limit decreased to {int(self.limit)}")
+            elif healthy:
+                if self.average_latency is None:
+                    self.average_latency = latency
+                if latency <= self.average_latency * self.latency_tolerance:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.average_latency += self.latency_smoothing * (latency - self.average_latency)
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        started = time.monotonic()
+        healthy = True
+        try:
+            yield
+        except TimeoutError:
+            healthy = False
+            raise
+        except ClientResponseError as e:
+            healthy = None if e.status != 429 and e.status < 500 else False
+            raise
+        except BaseException:
+            healthy = None
+            raise
+        finally:
+            await self.release(healthy, time.monotonic() - started)
+
+
+class ApifyClient:
+    settings = ApifyClientSettings()
+    session: ClientSession | None = None
+    limiter = AdaptiveLimiter(
+        initial=settings.apify_concurrency_initial,
+        minimum=settings.apify_concurrency_min,
+        maximum=settings.apify_concurrency_max,
+        latency_tolerance=settings.apify_latency_tolerance,
+    )
+
+    @classmethod
+    async def open(cls):
+        if cls.session is not None and not cls.session.closed:
+            return
+        connector = TCPConnector(
+            limit=cls.settings.apify_connection_limit,
+            limit_per_host=cls.settings.apify_connection_limit_per_host,
+            ttl_dns_cache=cls.settings.apify_dns_cache_ttl,
+            keepalive_timeout=cls.settings.apify_keepalive_timeout,
+        )
+        cls.session = ClientSession(connector=connector, timeout=cls.timeout())
+
+    @classmethod
+    async def close(cls):
+        if cls.session is not None:
+            await cls.session.close()
+            cls.session = None
+
+    @classmethod
+    async def get_session(cls) -> ClientSession:
+        # Scripts and background jobs may call actors without the app lifespan
+        await cls.open()
+        return cls.session
+
+    @classmethod
+    def timeout(cls, actor: str | None = None) -> ClientTimeout:
+        overrides = cls.settings.apify_actor_timeouts.get(actor, {}) if actor else {}
+        return ClientTimeout(
+            total=overrides.get("total", cls.settings.apify_total_timeout),
+            sock_connect=overrides.get("connect", cls.settings.apify_connect_timeout),
+            sock_read=overrides.get("read", cls.settings.apify_read_timeout),
+        )
 
 
 class ExternalRepository:
     url = "https://api.brightdata.com"
     token_header = {"Authorization": "Bearer " + os.getenv("EXTERNAL_TOKEN", "")}
     apify_token = os.getenv("APIFY_TOKEN")
+    profile_actor = "clockworks~tiktok-profile-scraper"
+    trend_video_actor = "novi~fast-tiktok-api"
+    trend_hashtag_actor = "lexis-solutions~tiktok-trending-hashtags-scraper"
+    trend_song_actor = "codebyte~tiktok-trending-songs-analytics"
+    video_chunk_size = int(os.getenv("APIFY_VIDEO_CHUNK_SIZE", "100"))
+    video_chunk_retries = int(os.getenv("APIFY_VIDEO_CHUNK_RETRIES", "2"))
+    stream_batch_size = int(os.getenv("APIFY_STREAM_BATCH_SIZE", "500"))
+    apify_url = os.getenv("APIFY_URL", "https://api.apify.com")
+    # "sync" uses run-sync-get-dataset-items, "async" starts a run and polls it
+    run_mode = os.getenv("APIFY_RUN_MODE", "sync")
+    run_terminal_statuses = ("SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT")
+    run_wait_seconds = 60
+    run_poll_interval = float(os.getenv("APIFY_RUN_POLL_INTERVAL", "5"))
+    dataset_page_size = int(os.getenv("APIFY_DATASET_PAGE_SIZE", "1000"))
+    dataset_page_concurrency = int(os.getenv("APIFY_DATASET_PAGE_CONCURRENCY", "4"))
+    # Wall-clock budget of one refresh cycle in seconds, 0 disables it
+    refresh_budget = float(os.getenv("APIFY_REFRESH_BUDGET", "10800"))
+    # A chunk slower than this percentile of recent chunks gets a duplicate request, 0 disables hedging
+    hedge_percentile = float(os.getenv("APIFY_HEDGE_PERCENTILE", "0.9"))
+    hedge_min_samples = int(os.getenv("APIFY_HEDGE_MIN_SAMPLES", "10"))
+    chunk_latencies: deque[float] = deque(maxlen=200)
 
-    async def get_user_data(self, nicknames: list[str]) -> list[ExternalDataSchema]:
-        async with ClientSession() as session:
-            resp = await session.post(
-                f"https://api.apify.com/v2/acts/sandaliaapps~tiktok-user-data-extractor/run-sync-get-dataset-items?token={self.apify_token}",
-                json={
-                    "start_urls": [{"url": f"https://www.tiktok.com/@{name}", "method": "GET"} for name in nicknames],
-                    "max_depth": 1
-                }
-            )
-            data = await resp.json()
-        logger.debug(f"Loaded {len(data)} users")
-        return [ExternalDataSchema.model_validate(row) for row in data]
+    @staticmethod
+    async def _iter_jsonl(resp: ClientResponse) -> AsyncIterator[bytes]:
+        resp.raise_for_status()
+        buffer = b""
+        async for chunk in resp.content.iter_any():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
 
-    async def get_video_data(self, nicknames: list[str]) -> list[ExternalVideoDataSchema]:
-        async with ClientSession() as session:
+    async def _stream_actor_lines(self, actor: str, payload: dict) -> AsyncIterator[bytes]:
+        # Dataset items are requested as JSON lines and passed on one by one,
+        # so the raw body never has to be held in memory
+        if self.run_mode == "async":
+            async for line in self._stream_actor_async(actor, payload):
+                yield line
+            return
+        session = await ApifyClient.get_session()
+        # The synchronous endpoint answers once the run is done, the limiter slot
+        # covers the run only and not the time the caller spends on the items
+        async with ApifyClient.limiter.slot():
             resp = await session.post(
-                f"https://api.apify.com/v2/acts/clockworks~tiktok-profile-scraper/run-sync-get-dataset-items?token={self.apify_token}",
-                json={
-                    "profiles": nicknames,
-                    "resultsPerPage": 5,
-                    "shouldDownloadVideos": True,
-                    "profileScrapeSections": [
-                        "videos"
-                    ]
-                }
+                f"{self.apify_url}/v2/acts/{actor}/run-sync-get-dataset-items",
+                params={"token": self.apify_token, "format": "jsonl"},
+                json=payload,
+                timeout=ApifyClient.timeout(actor),
             )
-            data = await resp.json()
-        logger.debug(f"Loaded {len(data)} video")
-        logger.debug([row for row in data if row.get("error") is not None])
-        return [
-            (ExternalVideoDataSchema.model_validate(row) if row.get('error') is None else ExternalVideoDataSchema(
-                error=row.get('error'),
-                authorMeta=ExternalVideoDataSchema.AuthorMeta(name=row.get("input", ''), avatar='')
-            ))
-            for row in data
+            resp.raise_for_status()
+        async with resp:
+            async for line in self._iter_jsonl(resp):
+                yield line
+
+    async def _stream_actor(self, actor: str, payload: dict) -> AsyncIterator[dict]:
+        async for line in self._stream_actor_lines(actor, payload):
+            yield json.loads(line)
+
+    async def _start_run(self, actor: str, payload: dict) -> dict:
+        session = await ApifyClient.get_session()
+        async with session.post(
+            f"{self.apify_url}/v2/acts/{actor}/runs",
+            params={"token": self.apify_token},
+            json=payload,
+        ) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["data"]
+
+    async def _wait_run(self, run: dict) -> dict:
+        session = await ApifyClient.get_session()
+        while run["status"] not in self.run_terminal_statuses:
+            async with session.get(
+                f"{self.apify_url}/v2/actor-runs/{run['id']}",
+                params={"token": self.apify_token, "waitForFinish": self.run_wait_seconds},
+            ) as resp:
+                resp.raise_for_status()
+                run = (await resp.json())["data"]
+            if run["status"] not in self.run_terminal_statuses:
+                await asyncio.sleep(self.run_poll_interval)
+        if run["status"] != "SUCCEEDED":
+            raise RuntimeError(f"Apify run {run['id']} finished with status {run['status']}")
+        return run
+
+    async def _abort_run(self, run: dict):
+        session = await ApifyClient.get_session()
+        async with session.post(
+            f"{self.apify_url}/v2/actor-runs/{run['id']}/abort",
+            params={"token": self.apify_token},
+        ) as resp:
+            if resp.status >= 400:
+                logger.warning(f"Failed to abort Apify run {run['id']}: {resp.status}")
+
+    async def _get_dataset_page(self, dataset_id: str, offset: int) -> list[bytes]:
+        session = await ApifyClient.get_session()
+        async with session.get(
+            f"{self.apify_url}/v2/datasets/{dataset_id}/items",
+            params={
+                "token": self.apify_token,
+                "format": "jsonl",
+                "offset": offset,
+                "limit": self.dataset_page_size,
+            },
+        ) as resp:
+            return [line async for line in self._iter_jsonl(resp)]
+
+    async def _stream_actor_async(self, actor: str, payload: dict) -> AsyncIterator[bytes]:
+        # Start the run, wait for it and download its dataset in parallel pages,
+        # so no single long-lived response has to survive the whole scrape
+        async with ApifyClient.limiter.slot():
+            run = await self._start_run(actor, payload)
+            try:
+                run = await self._wait_run(run)
+            except asyncio.CancelledError:
+                # Do not leave abandoned (e.g. hedged) runs spending compute units
+                await asyncio.shield(self._abort_run(run))
+                raise
+        dataset_id = run["defaultDatasetId"]
+        session = await ApifyClient.get_session()
+        async with session.get(
+            f"{self.apify_url}/v2/datasets/{dataset_id}",
+            params={"token": self.apify_token},
+        ) as resp:
+            resp.raise_for_status()
+            item_count = (await resp.json())["data"]["itemCount"]
+        logger.debug(f"Apify run {run['id']} finished with {item_count} items")
+
+        offsets = list(range(0, item_count, self.dataset_page_size))
+        # Pages are fetched window by window to keep memory bounded
+        for i in range(0, len(offsets), self.dataset_page_concurrency):
+            window = offsets[i:i + self.dataset_page_concurrency]
+            pages = await asyncio.gather(*[self._get_dataset_page(dataset_id, offset) for offset in window])
+            for page in pages:
+                for line in page:
+                    yield line
+
+    async def _run_actor(self, actor: str, payload: dict) -> list[dict]:
+        return [row async for row in self._stream_actor(actor, payload)]
+
+    @staticmethod
+    def _video_payload(nicknames: list[str]) -> dict:
+        return {
+            "profiles": nicknames,
+            "resultsPerPage": 5,
+            "shouldDownloadVideos": True,
+            "profileScrapeSections": [
+                "videos"
+            ]
+        }
+
+    @staticmethod
+    def _strip_keys(line: bytes) -> bytes:
+        # Same top-level normalisation as ExternalVideoDataSchema.strip_keys,
+        # only lines that may have a padded key are decoded in Python
+        # (a padded key has '" ' or ' ":', which may also be inside a value)
+        if b'" ' not in line and b' ":' not in line:
+            return line
+        row = json.loads(line)
+        if not isinstance(row, dict):
+            return line
+        return json.dumps({key.strip(' '): value for key, value in row.items()}).encode()
+
+    @classmethod
+    def _decode_video_rows(cls, lines: list[bytes]) -> list[ExternalVideoStatsRow]:
+        # The whole batch is validated by pydantic-core in one call,
+        # only items with padded keys go through a dict first
+        lines = [cls._strip_keys(line) for line in lines]
+        rows = ExternalVideoStatsRows.validate_json(b"[" + b",".join(lines) + b"]")
+        errors = [row for row in rows if row.error is not None]
+        if errors:
+            logger.debug(errors)
+        return rows
+
+    async def iter_video_data(self, nicknames: list[str]) -> AsyncIterator[list[ExternalVideoStatsRow]]:
+        lines = self._stream_actor_lines(self.profile_actor, self._video_payload(nicknames))
+        batch = []
+        count = 0
+        async for line in lines:
+            batch.append(line)
+            if len(batch) >= self.stream_batch_size:
+                count += len(batch)
+                yield self._decode_video_rows(batch)
+                batch = []
+        if batch:
+            count += len(batch)
+            yield self._decode_video_rows(batch)
+        logger.debug(f"Loaded {count} video")
+
+    def _hedge_delay(self) -> float | None:
+        if not self.hedge_percentile or len(self.chunk_latencies) < self.hedge_min_samples:
+            return None
+        latencies = sorted(self.chunk_latencies)
+        return latencies[min(int(len(latencies) * self.hedge_percentile), len(latencies) - 1)]
+
+    async def _hedged[T](self, call: Callable[[], Awaitable[T]]) -> T:
+        # Run call, and if it is slower than the hedge delay run it once more,
+        # keeping whichever finishes first and cancelling the other
+        started = time.monotonic()
+        tasks = {asyncio.ensure_future(call())}
+        delay = self._hedge_delay()
+        error = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                logger.info(f"Chunk is slower than {delay:.0f}s, sending a hedged request")
+                tasks.add(asyncio.ensure_future(call()))
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.chunk_latencies.append(time.monotonic() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _iter_video_data_hedged(self, nicknames: list[str]) -> AsyncIterator[list[ExternalVideoStatsRow]]:
+        # A hedged chunk is buffered, so that only the winning response is stored
+        async def collect():
+            return [batch async for batch in self.iter_video_data(nicknames)]
+
+        for batch in await self._hedged(collect):
+            yield batch
+
+    async def get_video_data_chunked(
+            self,
+            nicknames: list[str],
+            on_batch: Callable[[list[str], list[ExternalVideoStatsRow]], Awaitable[None]],
+            budget: float | None = None,
+    ):
+        # Each batch is stored by on_batch as soon as it is scraped,
+        # a failed chunk is retried alone (unless some of it is already stored)
+        # and dropped after the last attempt. All chunks are started at once,
+        # the adaptive limiter decides how many actor runs are in flight.
+        if budget is None:
+            budget = self.refresh_budget
+        chunks = [
+            nicknames[i:i + self.video_chunk_size]
+            for i in range(0, len(nicknames), self.video_chunk_size)
         ]
+        finished = 0
+
+        async def run_chunk(chunk: list[str]):
+            nonlocal finished
+            for attempt in range(self.video_chunk_retries + 1):
+                stored = 0
+                if self.hedge_percentile:
+                    batches = self._iter_video_data_hedged(chunk)
+                else:
+                    batches = self.iter_video_data(chunk)
+                try:
+                    async for batch in batches:
+                        await on_batch(chunk, batch)
+                        stored += len(batch)
+                    finished += 1
+                    return
+                except Exception as e:
+                    logger.warning(f"Video chunk of {len(chunk)} failed (attempt {attempt + 1}): {e!r}")
+                    if stored:
+                        break
+                    if attempt < self.video_chunk_retries:
+                        await asyncio.sleep(2 ** attempt)
+            logger.error(f"Video chunk dropped: {chunk}")
+
+        try:
+            async with asyncio.timeout(budget or None):
+                results = await asyncio.gather(*[run_chunk(chunk) for chunk in chunks], return_exceptions=True)
+        except TimeoutError:
+            logger.error(f"Refresh budget of {budget:.0f}s exhausted, {len(chunks) - finished} of {len(chunks)} chunks unfinished")
+            return
+        for result in results:
+            if isinstance(result, Exception):
+                logger.exception(result)
 
     async def get_trend_hashtags_data(self) -> list[ExternalTrendHashtagDataSchema]:
-        async with ClientSession() as session:
-            resp = await session.post(
-                f"https://api.apify.com/v2/acts/lexis-solutions~tiktok-trending-hashtags-scraper/run-sync-get-dataset-items?token={self.apify_token}",
-                json={"period": "30", "countryCode": "US", "maxItems": 50}
-            )
-            data = await resp.json()
+        data = await self._run_actor(
+            self.trend_hashtag_actor,
+            {"period": "30", "countryCode": "US", "maxItems": 50}
+        )
         logger.debug(f"Loaded {len(data)} hashtags")
         return [ExternalTrendHashtagDataSchema.model_validate(row) for row in data]
 
     async def get_trend_videos_data(self) -> list[ExternalTrendVideoDataSchema]:
-        async with ClientSession() as session:
-            resp = await session.post(
-                f"https://api.apify.com/v2/acts/novi~fast-tiktok-api/run-sync-get-dataset-items?token={self.apify_token}",
-                json={"isUnlimited": False, "limit": 2, "proxyConfiguration": {"useApifyProxy": False}, "publishTime": "ALL_TIME", "sortType": 0, "type": "TREND"}
-            )
-            data = await resp.json()
+        data = await self._run_actor(
+            self.trend_video_actor,
+            {"isUnlimited": False, "limit": 2, "proxyConfiguration": {"useApifyProxy": False}, "publishTime": "ALL_TIME", "sortType": 0, "type": "TREND"}
+        )
         logger.debug(f"Loaded {len(data)} videos")
         return [ExternalTrendVideoDataSchema.model_validate(row) for row in data]
 
     async def get_trend_songs_data(self) -> list[ExternalTrendSongDataSchema]:
-        async with ClientSession() as session:
-            resp = await session.post(
-                f"https://api.apify.com/v2/acts/codebyte~tiktok-trending-songs-analytics/run-sync-get-dataset-items?token={self.apify_token}",
-                json={"result_type": "top100", "top100_commercial_music": False, "top100_new_on_board": False, "country": "US", "period": "7", "top100_rank_type": "popular"}
-            )
-            data = await resp.json()
+        data = await self._run_actor(
+            self.trend_song_actor,
+            {"result_type": "top100", "top100_commercial_music": False, "top100_new_on_board": False, "country": "US", "period": "7", "top100_rank_type": "popular"}
+        )
         logger.debug(f"Loaded {len(data)} songs")
         return [ExternalTrendSongDataSchema.model_validate(row) for row in data]
 
@@ -0,0 +1,49 @@
+import uuid
+from pydantic_settings import BaseSettings
+from redis.asyncio import Redis
+
+from app.db.redis import pool
+
+
+class LeaderSettings(BaseSettings):
+    leader_lock_key: str = "scheduler:leader"
+    # A leader that stops renewing loses the lock after this many seconds
+    leader_lock_ttl: float = 30
+    leader_lock_renew_interval: float = 10
+
+
+# Only the holder of the token may extend or release the lock
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLock:
+    def __init__(self, settings: LeaderSettings | None = None, redis: Redis | None = None):
+        self.settings = settings or LeaderSettings()
+        self.redis = redis or Redis(connection_pool=pool)
+        self.token = uuid.uuid4().hex
+        self._renew = self.redis.register_script(RENEW_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+
+    @property
+    def _ttl_ms(self) -> int:
+        return int(self.settings.leader_lock_ttl * 1000)
+
+    async def acquire(self) -> bool:
+        return bool(await self.redis.set(self.settings.leader_lock_key, self.token, nx=True, px=self._ttl_ms))
+
+    async def renew(self) -> bool:
+        return bool(await self._renew(keys=[self.settings.leader_lock_key], args=[self.token, self._ttl_ms]))
+
+    async def release(self):
+        await self._release(keys=[self.settings.leader_lock_key], args=[self.token])
@@ -0,0 +1,30 @@
+import hashlib
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from .base import BaseRepository
+from app.db.tables import MediaObject
+
+
+class MediaRepository(BaseRepository):
+    base_table = MediaObject
+
+    @staticmethod
+    def url_hash(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    async def get_by_urls(self, urls: list[str]) -> dict[str, MediaObject]:
+        if not urls:
+            return {}
+        query = select(MediaObject).where(MediaObject.source_url_hash.in_([self.url_hash(url) for url in urls]))
+        return {model.source_url: model for model in await self.session.scalars(query)}
+
+    async def get_by_sha256(self, sha256: str) -> MediaObject:
+        return await self._get_one(sha256=sha256)
+
+    async def bulk_store(self, rows: list[dict], do_commit=True):
+        if rows:
+            query = insert(MediaObject).on_conflict_do_nothing(index_elements=[MediaObject.source_url_hash])
+            await self.session.execute(query, rows)
+        if do_commit:
+            await self.commit()
@@ -0,0 +1,135 @@
+import datetime as dt
+import re
+
+from loguru import logger
+from pydantic_settings import BaseSettings
+from sqlalchemy import text, delete
+
+from .base import BaseRepository
+from .video_delta import VideoDeltaRepository
+from app.db.tables import UserStats, VideoStats, VideoStatsArchive
+
+
+class PartitionSettings(BaseSettings):
+    # Monthly partitions created ahead of time
+    stats_partitions_ahead: int = 3
+    # Partitions entirely older than this are removed, 0 keeps the whole history
+    stats_retention_days: int = 0
+    # Detached partitions stay in the database as plain tables until archived and dropped by hand
+    stats_retention_drop: bool = False
+    # video_statss partitions entirely older than this are packed into video_stats_archives, 0 disables it
+    stats_compaction_age_days: int = 0
+
+
+class PartitionRepository(BaseRepository):
+    base_table = UserStats
+    tables = (UserStats.__tablename__, VideoStats.__tablename__)
+    settings = PartitionSettings()
+    # Serialises maintenance between API replicas and workers
+    lock_id = 7201
+    upper_bound = re.compile(r"TO \('([^']+)'\)")
+
+    @staticmethod
+    def month_start(value: dt.datetime, months: int = 0) -> dt.datetime:
+        month = value.year * 12 + value.month - 1 + months
+        return dt.datetime(month // 12, month % 12 + 1, 1)
+
+    @staticmethod
+    def partition_name(table: str, start: dt.datetime) -> str:
+        return f"{table}_p{start:%Y_%m}"
+
+    async def get_partitions(self, table: str) -> list[tuple[str, dt.datetime | None]]:
+        # Upper bound of every partition, None for the ones open to MAXVALUE
+        query = text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = CAST(:table AS regclass)"
+        )
+        partitions = []
+        for name, bound in (await self.session.execute(query, {"table": table})).fetchall():
+            match = self.upper_bound.search(bound)
+            partitions.append((name, dt.datetime.fromisoformat(match.group(1)) if match else None))
+        return partitions
+
+    async def ensure_partitions(self, table: str, now: dt.datetime) -> list[str]:
+        partitions = await self.get_partitions(table)
+        bounds = [upper for _, upper in partitions if upper is not None]
+        if len(bounds) < len(partitions):
+            return []
+        start = max(bounds) if bounds else self.month_start(now)
+        created = []
+        while start < self.month_start(now, self.settings.stats_partitions_ahead + 1):
+            end = self.month_start(start, 1)
+            name = self.partition_name(table, start)
+            await self.session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            created.append(name)
+            start = end
+        return created
+
+    async def apply_retention(self, table: str, now: dt.datetime) -> list[str]:
+        if not self.settings.stats_retention_days:
+            return []
+        # Never drop rows that unchanged videos are still carried forward from
+        cutoff = now - max(
+            dt.timedelta(days=self.settings.stats_retention_days),
+            VideoDeltaRepository.carry_forward + dt.timedelta(days=1),
+        )
+        removed = []
+        for name, upper in await self.get_partitions(table):
+            if upper is None or upper > cutoff:
+                continue
+            await self.session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if self.settings.stats_retention_drop:
+                await self.session.execute(text(f"DROP TABLE {name}"))
+            removed.append(name)
+        if table == VideoStats.__tablename__:
+            await self.session.execute(delete(VideoStatsArchive).where(VideoStatsArchive.period_end <= cutoff))
+        return removed
+
+    async def compact_partition(self, name: str) -> int:
+        # One archive row per video and month, a partition that got late rows
+        # after its compaction appends them to the existing archive rows
+        month = "date_trunc('month', created_at)"
+        result = await self.session.execute(text(
+            f"INSERT INTO {VideoStatsArchive.__tablename__} "
+            "(video_key, period_start, period_end, created_ats, views, comments, diggs, shares) "
+            f"SELECT video_key, {month}, {month} + interval '1 month', array_agg(created_at ORDER BY created_at), "
+            "array_agg(views ORDER BY created_at), array_agg(comments ORDER BY created_at), "
+            "array_agg(diggs ORDER BY created_at), array_agg(shares ORDER BY created_at) "
+            f"FROM {name} GROUP BY video_key, {month} "
+            "ON CONFLICT (video_key, period_start) DO UPDATE SET "
+            "created_ats = video_stats_archives.created_ats || excluded.created_ats, "
+            "views = video_stats_archives.views || excluded.views, "
+            "comments = video_stats_archives.comments || excluded.comments, "
+            "diggs = video_stats_archives.diggs || excluded.diggs, "
+            "shares = video_stats_archives.shares || excluded.shares"
+        ))
+        # The partition stays attached, so late writes still have somewhere to go
+        await self.session.execute(text(f"TRUNCATE {name}"))
+        return result.rowcount
+
+    async def compact(self, now: dt.datetime):
+        if not self.settings.stats_compaction_age_days:
+            return
+        cutoff = now - dt.timedelta(days=self.settings.stats_compaction_age_days)
+        table = VideoStats.__tablename__
+        for name, upper in await self.get_partitions(table):
+            if upper is None or upper > cutoff:
+                continue
+            # A transaction per partition, the lock is taken again for each of them
+            await self.session.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": self.lock_id})
+            if await self.session.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})")):
+                packed = await self.compact_partition(name)
+                logger.info(f"Compacted {name} into {packed} archive rows")
+            await self.commit()
+
+    async def maintain(self, now: dt.datetime):
+        await self.session.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": self.lock_id})
+        for table in self.tables:
+            created = await self.ensure_partitions(table, now)
+            removed = await self.apply_retention(table, now)
+            if created or removed:
+                logger.info(f"Partitions of {table}: created {created}, removed {removed}")
+        await self.commit()
@@ -0,0 +1,116 @@
+import json
+import time
+import uuid
+from loguru import logger
+from pydantic import BaseModel
+from pydantic_settings import BaseSettings
+from redis.asyncio import Redis
+
+from app.db.redis import pool
+
+
+class QueueSettings(BaseSettings):
+    # Hand scrapes to app.worker processes instead of running them in app.scheduler
+    queue_enabled: bool = False
+    queue_name: str = "scrape"
+    queue_visibility_timeout: float = 30 * 60
+    queue_max_attempts: int = 5
+    queue_backoff_seconds: float = 60
+    queue_max_backoff_seconds: float = 60 * 60
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    payload: dict
+    attempts: int = 0
+
+
+# Jobs live in one sorted set scored by the time they become visible.
+# Reserving a job pushes its score past the visibility timeout, so an
+# unacknowledged job reappears on its own once the timeout expires.
+RESERVE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #ids == 0 then
+    return nil
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ids[1])
+redis.call('HINCRBY', KEYS[2] .. ids[1], 'attempts', 1)
+return ids[1]
+"""
+
+
+class JobQueue:
+    def __init__(self, settings: QueueSettings | None = None, redis: Redis | None = None):
+        self.settings = settings or QueueSettings()
+        self.redis = redis or Redis(connection_pool=pool)
+        self._reserve = self.redis.register_script(RESERVE_SCRIPT)
+
+    @property
+    def _jobs_key(self) -> str:
+        return f"queue:{self.settings.queue_name}:jobs"
+
+    @property
+    def _job_prefix(self) -> str:
+        return f"queue:{self.settings.queue_name}:job:"
+
+    @property
+    def _dead_key(self) -> str:
+        return f"queue:{self.settings.queue_name}:dead"
+
+    async def enqueue(self, kind: str, payload: dict, delay: float = 0) -> str:
+        job_id = uuid.uuid4().hex
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._job_prefix + job_id, mapping={"kind": kind, "payload": json.dumps(payload), "attempts": 0})
+            pipe.zadd(self._jobs_key, {job_id: time.time() + delay})
+            await pipe.execute()
+        logger.debug(f"Enqueued {kind} job {job_id}")
+        return job_id
+
+    async def reserve(self) -> Job | None:
+        now = time.time()
+        job_id = await self._reserve(
+            keys=[self._jobs_key, self._job_prefix],
+            args=[now, now + self.settings.queue_visibility_timeout],
+        )
+        if job_id is None:
+            return None
+        data = await self.redis.hgetall(self._job_prefix + job_id)
+        if not data:
+            # Acknowledged concurrently, drop the stale entry
+            await self.redis.zrem(self._jobs_key, job_id)
+            return None
+        return Job(id=job_id, kind=data["kind"], payload=json.loads(data["payload"]), attempts=int(data["attempts"]))
+
+    async def touch(self, job: Job):
+        # Extend the visibility timeout of a job that is still being processed
+        await self.redis.zadd(
+            self._jobs_key,
+            {job.id: time.time() + self.settings.queue_visibility_timeout},
+            xx=True,
+        )
+
+    async def ack(self, job: Job):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self._jobs_key, job.id)
+            pipe.delete(self._job_prefix + job.id)
+            await pipe.execute()
+
+    async def fail(self, job: Job, error: str):
+        if job.attempts >= self.settings.queue_max_attempts:
+            logger.error(f"{job.kind} job {job.id} is dead after {job.attempts} attempts: {error}")
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(self._dead_key, json.dumps(job.model_dump() | {"error": error}))
+                pipe.zrem(self._jobs_key, job.id)
+                pipe.delete(self._job_prefix + job.id)
+                await pipe.execute()
+            return
+        backoff = min(
+            self.settings.queue_backoff_seconds * 2 ** (job.attempts - 1),
+            self.settings.queue_max_backoff_seconds,
+        )
+        logger.warning(f"{job.kind} job {job.id} failed, retry in {backoff}s: {error}")
+        await self.redis.zadd(self._jobs_key, {job.id: time.time() + backoff}, xx=True)
+
+    async def size(self) -> int:
+        return await self.redis.zcard(self._jobs_key)
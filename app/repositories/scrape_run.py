@@ -0,0 +1,69 @@
+import asyncio
+import datetime as dt
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy import select, delete, func
+
+from .base import BaseRepository
+from app.db.replicas import reads_replica
+from app.db.tables import ScrapeRun
+
+
+class ScrapeRunRepository(BaseRepository):
+    base_table = ScrapeRun
+
+    async def start(self, kind: str, actor: str, requested: int = 0) -> ScrapeRun:
+        run = ScrapeRun(kind=kind, actor=actor, requested=requested, started_at=dt.datetime.now())
+        self.session.add(run)
+        # Committed up front so the rows of the run can reference it
+        await self.commit()
+        return run
+
+    async def finish(self, run: ScrapeRun, status: str = "finished", error: str | None = None):
+        run.status = status
+        run.error = error
+        run.finished_at = dt.datetime.now()
+        self.session.add(run)
+        await self.commit()
+
+    async def _abort(self, run: ScrapeRun, run_status: str, error: str):
+        await self.session.rollback()
+        await self.finish(run, run_status, error)
+
+    @asynccontextmanager
+    async def track(self, kind: str, actor: str, requested: int = 0) -> AsyncIterator[ScrapeRun]:
+        # The run is finished with the status set by the caller, failed if the body
+        # raises, or cancelled by the refresh budget, a lost leader lock or shutdown
+        run = await self.start(kind, actor, requested)
+        try:
+            yield run
+        except BaseException as e:
+            run_status = "cancelled" if isinstance(e, asyncio.CancelledError) else "failed"
+            await asyncio.shield(self._abort(run, run_status, repr(e)))
+            raise
+        await self.finish(run, "finished" if run.status == "running" else run.status)
+
+    @reads_replica
+    async def get_latest_complete(self, kind: str) -> ScrapeRun | None:
+        query = (
+            select(ScrapeRun)
+            .where(ScrapeRun.kind == kind)
+            .where(ScrapeRun.status == "finished")
+            .order_by(ScrapeRun.id.desc())
+            .limit(1)
+        )
+        return await self.session.scalar(query)
+
+    async def get(self, run_id: int) -> ScrapeRun | None:
+        return await self.session.get(ScrapeRun, run_id)
+
+    async def is_latest(self, run: ScrapeRun) -> bool:
+        latest = await self.session.scalar(select(func.max(ScrapeRun.id)).where(ScrapeRun.kind == run.kind))
+        return latest == run.id
+
+    async def delete_run(self, run_id: int, do_commit=True):
+        # Snapshot and trend rows go with the run, rollups and latest_stats are not rewound
+        await self.session.execute(delete(ScrapeRun).where(ScrapeRun.id == run_id))
+        if do_commit:
+            await self.commit()
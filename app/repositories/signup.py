@@ -0,0 +1,24 @@
+from pydantic_settings import BaseSettings
+from redis.asyncio import Redis
+
+from app.db.redis import pool
+
+
+class SignupSettings(BaseSettings):
+    signup_pending_key: str = "signups:pending"
+
+
+class SignupRepository:
+    # New users waiting for their first stats load, the web process adds them
+    # and the scheduler process refreshes them on its next tick
+
+    def __init__(self, settings: SignupSettings | None = None, redis: Redis | None = None):
+        self.settings = settings or SignupSettings()
+        self.redis = redis or Redis(connection_pool=pool)
+
+    async def add(self, nicknames: list[str]):
+        if nicknames:
+            await self.redis.sadd(self.settings.signup_pending_key, *nicknames)
+
+    async def pop(self, count: int) -> list[str]:
+        return await self.redis.spop(self.settings.signup_pending_key, count) or []
@@ -1,67 +1,74 @@
-from sqlalchemy import select, delete, func
+from sqlalchemy import select, delete, update, func, insert, case, values, column, all_, true, union_all, String, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from loguru import logger
 from pydantic import BaseModel, ConfigDict
 import datetime as dt
 
 from .base import BaseRepository
-from app.db.tables import UserStats, VideoStats
-from app.db.tables import TrendVideo, TrendHashtag, TrendSong
+from .video_delta import VideoDeltaRepository
+from app.db.replicas import reads_replica
+from app.db.tables import UserStats, Video, VideoStats, VideoStatsArchive, LatestStats
+from app.db.tables import DailyUserStats, DailyVideoStats
+from app.db.tables import TrendSnapshot, TrendVideo, TrendHashtag, TrendSong
 
 
 class Stats(BaseModel):
-    user_stats: UserStats
-    video_stats: list[VideoStats]
+    user_stats: LatestStats
+    video_stats: list[LatestStats]
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
 
 class StatsRepository(BaseRepository):
     base_table = UserStats
+    user_stats_columns = ("followers", "following", "likes", "diggs", "nickname", "video_ids", "run_id", "created_at")
+    video_stats_columns = ("video_key", "views", "comments", "diggs", "shares", "run_id", "created_at")
+    latest_video_columns = ("video_id", "views", "comments", "diggs", "shares", "nickname", "cover_url", "video_url", "created_at")
+    user_counters = ("followers", "following", "likes", "diggs")
+    video_counters = ("views", "comments", "diggs", "shares")
+    # Bounding video reads by the carry forward age lets Postgres prune partitions
+    carry_forward = VideoDeltaRepository.carry_forward
 
+    @reads_replica
     async def get_latest(self, nickname: str) -> Stats | None:
-        query = select(UserStats).order_by(UserStats.created_at.desc()).filter_by(nickname=nickname).limit(1)
-        user_stats = await self.session.scalar(query)
-        if user_stats is None:
+        # A single range scan of the latest_stats primary key, the user row sorts first
+        query = select(LatestStats).where(LatestStats.nickname == nickname).order_by(LatestStats.video_id)
+        rows = list(await self.session.scalars(query))
+        if not rows or rows[0].video_id != '':
             return None
-        query = select(VideoStats).filter_by(nickname=nickname, created_at=user_stats.created_at)
-        video_stats = await self.session.scalars(query)
-        return Stats(user_stats=user_stats, video_stats=list(video_stats))
+        return Stats(user_stats=rows[0], video_stats=rows[1:])
 
+    @reads_replica
     async def get_increase(self, nickname: str, days: int) -> dict:
         return {
             "user_stats": await self.get_increase_user(nickname, days),
             "video_stats": await self.get_increase_video(nickname, days),
         }
 
+    @reads_replica
     async def get_increase_video(self, nickname: str, days: int) -> dict:
         ago = (dt.datetime.now() - dt.timedelta(days=days))
         ago = ago.replace(hour=0, minute=0, second=0)
+        oldest = ago.date() - self.carry_forward
 
+        # The value at `ago` is the last counter of the latest rollup day before it,
+        # every video is read from at most its baseline and its latest rollup row
         first_record_subquery = (
-            select(
-                VideoStats.video_id,
-                VideoStats.views,
-                VideoStats.comments,
-                VideoStats.diggs,
-                VideoStats.shares,
-                func.row_number().over(partition_by=VideoStats.video_id, order_by=VideoStats.created_at).label('rn')
-            )
-            .where(VideoStats.created_at < ago)
-            .where(VideoStats.nickname == nickname)
+            select(DailyVideoStats)
+            .where(DailyVideoStats.nickname == nickname)
+            .where(DailyVideoStats.day < ago.date())
+            .where(DailyVideoStats.day >= oldest)
+            .order_by(DailyVideoStats.video_id, DailyVideoStats.day.desc())
+            .distinct(DailyVideoStats.video_id)
         ).subquery()
 
         latest_record_subquery = (
-            select(
-                VideoStats.video_id,
-                VideoStats.views,
-                VideoStats.comments,
-                VideoStats.diggs,
-                VideoStats.shares,
-                VideoStats.video_url,
-                VideoStats.cover_url,
-                VideoStats.nickname,
-                func.row_number().over(partition_by=VideoStats.video_id, order_by=VideoStats.created_at.desc()).label('rn')
-            )
-            .where(VideoStats.nickname == nickname)
+            select(DailyVideoStats)
+            .where(DailyVideoStats.nickname == nickname)
+            .where(DailyVideoStats.day >= oldest)
+            .order_by(DailyVideoStats.video_id, DailyVideoStats.day.desc())
+            .distinct(DailyVideoStats.video_id)
         ).subquery()
 
         final_query = (
@@ -70,14 +77,12 @@ class StatsRepository(BaseRepository):
                 latest_record_subquery.c.video_url,
                 latest_record_subquery.c.cover_url,
                 latest_record_subquery.c.nickname,
-                (latest_record_subquery.c.views - first_record_subquery.c.views).label('views'),
-                (latest_record_subquery.c.comments - first_record_subquery.c.comments).label('comments'),
-                (latest_record_subquery.c.diggs - first_record_subquery.c.diggs).label('diggs'),
-                (latest_record_subquery.c.shares - first_record_subquery.c.shares).label('shares'),
+                (latest_record_subquery.c.last_views - first_record_subquery.c.last_views).label('views'),
+                (latest_record_subquery.c.last_comments - first_record_subquery.c.last_comments).label('comments'),
+                (latest_record_subquery.c.last_diggs - first_record_subquery.c.last_diggs).label('diggs'),
+                (latest_record_subquery.c.last_shares - first_record_subquery.c.last_shares).label('shares'),
             )
             .join(first_record_subquery, latest_record_subquery.c.video_id == first_record_subquery.c.video_id)
-            .where(latest_record_subquery.c.rn == 1)
-            .where(first_record_subquery.c.rn == 1)
         )
         results = (await self.session.execute(final_query)).fetchall()
 
@@ -95,33 +100,272 @@ class StatsRepository(BaseRepository):
             for row in results
         ]
 
+    @reads_replica
     async def get_increase_user(self, nickname: str, days: int) -> dict:
         ago = (dt.datetime.now() - dt.timedelta(days=days))
         ago = ago.replace(hour=0, minute=0, second=0)
 
-        query = select(UserStats).order_by(UserStats.created_at).where(UserStats.created_at >= ago).filter_by(nickname=nickname).limit(1)
+        query = select(DailyUserStats).order_by(DailyUserStats.day).where(DailyUserStats.day >= ago.date()).filter_by(nickname=nickname).limit(1)
         first_stats = await self.session.scalar(query)
         if first_stats is None:
             return {"followers": 0, "following": 0, "likes": 0, "diggs": 0, "created_at": ago, "nickname": nickname}
-            return UserStats(followers=0, following=0, likes=0, diggs=0)
-        second_stats = await self.get_latest(nickname)
+        query = select(DailyUserStats).order_by(DailyUserStats.day.desc()).filter_by(nickname=nickname).limit(1)
+        second_stats = await self.session.scalar(query)
 
         return {
-            "followers": second_stats.user_stats.followers - first_stats.followers,
-            "following": second_stats.user_stats.following - first_stats.following,
-            "likes": second_stats.user_stats.likes - first_stats.likes,
-            "diggs": second_stats.user_stats.diggs - first_stats.diggs,
-            "created_at": first_stats.created_at,
+            "followers": second_stats.last_followers - first_stats.first_followers,
+            "following": second_stats.last_following - first_stats.first_following,
+            "likes": second_stats.last_likes - first_stats.first_likes,
+            "diggs": second_stats.last_diggs - first_stats.first_diggs,
+            "created_at": first_stats.first_at,
             "nickname": nickname
         }
 
-    async def store_user(self, model: UserStats, do_commit=True):
-        self.session.add(model)
+    @staticmethod
+    def video_history(since: dt.datetime):
+        # Raw snapshot rows and compacted archive rows unpacked into the same shape
+        packed = func.unnest(
+            VideoStatsArchive.created_ats,
+            VideoStatsArchive.views,
+            VideoStatsArchive.comments,
+            VideoStatsArchive.diggs,
+            VideoStatsArchive.shares,
+        ).table_valued("created_at", "views", "comments", "diggs", "shares").render_derived()
+        raw = select(
+            VideoStats.video_key, VideoStats.views, VideoStats.comments,
+            VideoStats.diggs, VideoStats.shares, VideoStats.created_at,
+        ).where(VideoStats.created_at >= since)
+        archived = (
+            select(
+                VideoStatsArchive.video_key, packed.c.views, packed.c.comments,
+                packed.c.diggs, packed.c.shares, packed.c.created_at,
+            )
+            .select_from(VideoStatsArchive)
+            .join(packed, true())
+            .where(VideoStatsArchive.period_end > since)
+            .where(packed.c.created_at >= since)
+        )
+        return union_all(raw, archived).subquery("video_history")
+
+    @reads_replica
+    async def get_growth(self, since: dt.datetime, nicknames: list[str] | None = None) -> dict[str, dict]:
+        user_query = (
+            select(
+                UserStats.nickname,
+                func.min(UserStats.created_at),
+                func.max(UserStats.created_at),
+                func.min(UserStats.followers),
+                func.max(UserStats.followers),
+            )
+            .where(UserStats.created_at >= since)
+            .group_by(UserStats.nickname)
+        )
+        history = self.video_history(since)
+        video_subquery = (
+            select(
+                Video.nickname,
+                (func.max(history.c.views) - func.min(history.c.views)).label('views'),
+            )
+            .select_from(history)
+            .join(Video, Video.id == history.c.video_key)
+            .group_by(Video.nickname, history.c.video_key)
+        )
+        if nicknames is not None:
+            user_query = user_query.where(UserStats.nickname.in_(nicknames))
+            video_subquery = video_subquery.where(Video.nickname.in_(nicknames))
+        video_subquery = video_subquery.subquery()
+        video_query = (
+            select(video_subquery.c.nickname, func.sum(video_subquery.c.views))
+            .group_by(video_subquery.c.nickname)
+        )
+
+        views = dict((await self.session.execute(video_query)).fetchall())
+        return {
+            row[0]: {
+                "first_at": row[1],
+                "last_at": row[2],
+                "min_followers": row[3],
+                "max_followers": row[4],
+                "views": views.get(row[0]) or 0,
+            }
+            for row in (await self.session.execute(user_query)).fetchall()
+        }
+
+    async def get_run_video_ids(self, run_id: int) -> list[str]:
+        query = (
+            select(Video.video_id)
+            .join(VideoStats, VideoStats.video_key == Video.id)
+            .where(VideoStats.run_id == run_id)
+        )
+        return list(await self.session.scalars(query))
+
+    async def _copy_rows(self, table, columns: tuple[str, ...], rows: list[dict]):
+        # Binary COPY through the session connection, no ORM objects are created.
+        # The asyncpg adapter only opens the real transaction on the first
+        # statement, a COPY sent before that would commit on its own.
+        if not rows:
+            return
+        await self.session.execute(text("SELECT 1"))
+        connection = await self.session.connection()
+        raw_connection = (await connection.get_raw_connection()).driver_connection
+        if hasattr(raw_connection, "copy_records_to_table"):
+            await raw_connection.copy_records_to_table(
+                table.__tablename__,
+                records=[tuple(row[key] for key in columns) for row in rows],
+                columns=columns,
+            )
+        else:
+            logger.debug(f"COPY is not available, inserting {len(rows)} rows into {table.__tablename__}")
+            await self.session.execute(insert(table), [{key: row[key] for key in columns} for row in rows])
+
+    async def bulk_store_users(self, rows: list[dict], do_commit=True):
+        await self._copy_rows(UserStats, self.user_stats_columns, rows)
         if do_commit:
             await self.commit()
 
-    async def store_video(self, model: VideoStats, do_commit=True):
-        self.session.add(model)
+    async def resolve_videos(self, rows: list[dict]) -> dict[str, int]:
+        # Keys of the videos in rows, unknown videos are added and changed URLs updated
+        latest = {row["video_id"]: row for row in rows}
+        if not latest:
+            return {}
+        query = select(Video.id, Video.video_id, Video.cover_url, Video.video_url)
+        known = {video.video_id: video for video in await self.session.execute(query.where(Video.video_id.in_(latest)))}
+        missing = [row for video_id, row in latest.items() if video_id not in known]
+        if missing:
+            await self.session.execute(
+                pg_insert(Video).on_conflict_do_nothing(index_elements=[Video.video_id]),
+                [
+                    {
+                        "video_id": row["video_id"],
+                        "nickname": row["nickname"],
+                        "cover_url": row["cover_url"],
+                        "video_url": row["video_url"],
+                        "first_seen_at": row["created_at"],
+                    }
+                    for row in missing
+                ],
+            )
+            # Read back instead of RETURNING, another worker may have inserted some of them
+            ids = [row["video_id"] for row in missing]
+            known |= {video.video_id: video for video in await self.session.execute(query.where(Video.video_id.in_(ids)))}
+        changed = [
+            (video_id, row["cover_url"], row["video_url"])
+            for video_id, row in latest.items()
+            if (known[video_id].cover_url, known[video_id].video_url) != (row["cover_url"], row["video_url"])
+        ]
+        if changed:
+            urls = values(
+                column("video_id", String),
+                column("cover_url", String),
+                column("video_url", String),
+                name="urls",
+            ).data(changed)
+            await self.session.execute(
+                update(Video)
+                .where(Video.video_id == urls.c.video_id)
+                .values(cover_url=urls.c.cover_url, video_url=urls.c.video_url)
+                .execution_options(synchronize_session=False)
+            )
+        return {video_id: video.id for video_id, video in known.items()}
+
+    async def bulk_store_videos(self, rows: list[dict], do_commit=True):
+        keys = await self.resolve_videos(rows)
+        facts = [row | {"video_key": keys[row["video_id"]]} for row in rows]
+        await self._copy_rows(VideoStats, self.video_stats_columns, facts)
+        if do_commit:
+            await self.commit()
+
+    @staticmethod
+    def _rollup_rows(rows: list[dict], key: tuple[str, ...], counters: tuple[str, ...], latest: tuple[str, ...]) -> list[dict]:
+        # Folds snapshot rows into one first/last/min/max row per key and day
+        rollups = {}
+        for row in sorted(rows, key=lambda row: row["created_at"]):
+            day = row["created_at"].date()
+            rollup = rollups.get((*(row[name] for name in key), day))
+            if rollup is None:
+                rollup = {name: row[name] for name in key} | {"day": day, "first_at": row["created_at"]}
+                for counter in counters:
+                    rollup |= {f"first_{counter}": row[counter], f"min_{counter}": row[counter], f"max_{counter}": row[counter]}
+                rollups[(*(row[name] for name in key), day)] = rollup
+            rollup["last_at"] = row["created_at"]
+            for counter in counters:
+                rollup[f"last_{counter}"] = row[counter]
+                rollup[f"min_{counter}"] = min(rollup[f"min_{counter}"], row[counter])
+                rollup[f"max_{counter}"] = max(rollup[f"max_{counter}"], row[counter])
+            rollup |= {name: row[name] for name in latest}
+        return list(rollups.values())
+
+    async def _store_rollups(self, table, key: tuple[str, ...], counters: tuple[str, ...], latest: tuple[str, ...], rows: list[dict]):
+        rollups = self._rollup_rows(rows, key, counters, latest)
+        if not rollups:
+            return
+        query = pg_insert(table)
+        current, excluded = table.__table__.c, query.excluded
+        older = excluded.first_at < current.first_at
+        newer = excluded.last_at >= current.last_at
+        set_ = {
+            "first_at": func.least(current.first_at, excluded.first_at),
+            "last_at": func.greatest(current.last_at, excluded.last_at),
+        }
+        for counter in counters:
+            set_[f"first_{counter}"] = case((older, excluded[f"first_{counter}"]), else_=current[f"first_{counter}"])
+            set_[f"last_{counter}"] = case((newer, excluded[f"last_{counter}"]), else_=current[f"last_{counter}"])
+            set_[f"min_{counter}"] = func.least(current[f"min_{counter}"], excluded[f"min_{counter}"])
+            set_[f"max_{counter}"] = func.greatest(current[f"max_{counter}"], excluded[f"max_{counter}"])
+        for name in latest:
+            set_[name] = case((newer, excluded[name]), else_=current[name])
+        query = query.on_conflict_do_update(index_elements=[*key, "day"], set_=set_)
+        await self.session.execute(query, rollups)
+
+    async def store_user_rollups(self, rows: list[dict], do_commit=True):
+        await self._store_rollups(DailyUserStats, ("nickname",), self.user_counters, (), rows)
+        if do_commit:
+            await self.commit()
+
+    async def store_video_rollups(self, rows: list[dict], do_commit=True):
+        await self._store_rollups(
+            DailyVideoStats, ("nickname", "video_id"), self.video_counters, ("cover_url", "video_url"), rows,
+        )
+        if do_commit:
+            await self.commit()
+
+    async def store_latest_users(self, rows: list[dict], do_commit=True):
+        # Upserts the user row and drops the videos that are no longer on the profile
+        if rows:
+            query = pg_insert(LatestStats)
+            query = query.on_conflict_do_update(
+                index_elements=[LatestStats.nickname, LatestStats.video_id],
+                set_={name: query.excluded[name] for name in (*self.user_counters, "created_at")},
+                where=query.excluded.created_at >= LatestStats.created_at,
+            )
+            await self.session.execute(query, [
+                {name: row[name] for name in (*self.user_counters, "nickname", "created_at")} | {"video_id": ""}
+                for row in rows
+            ])
+            current = values(
+                column("nickname", String),
+                column("video_ids", ARRAY(String)),
+                name="current",
+            ).data([(row["nickname"], row["video_ids"] or []) for row in rows])
+            await self.session.execute(
+                delete(LatestStats)
+                .where(LatestStats.nickname == current.c.nickname)
+                .where(LatestStats.video_id != '')
+                .where(LatestStats.video_id != all_(current.c.video_ids))
+                .execution_options(synchronize_session=False)
+            )
+        if do_commit:
+            await self.commit()
+
+    async def store_latest_videos(self, rows: list[dict], do_commit=True):
+        if rows:
+            query = pg_insert(LatestStats)
+            query = query.on_conflict_do_update(
+                index_elements=[LatestStats.nickname, LatestStats.video_id],
+                set_={name: query.excluded[name] for name in self.latest_video_columns if name not in ("nickname", "video_id")},
+                where=query.excluded.created_at >= LatestStats.created_at,
+            )
+            await self.session.execute(query, [{name: row[name] for name in self.latest_video_columns} for row in rows])
         if do_commit:
             await self.commit()
 
@@ -140,27 +384,41 @@ class StatsRepository(BaseRepository):
         if do_commit:
             await self.commit()
 
-    async def clear_trend_videos(self):
-        query = delete(TrendVideo)
-        await self.session.execute(query)
+    async def create_trend_snapshot(self) -> TrendSnapshot:
+        snapshot = TrendSnapshot()
+        self.session.add(snapshot)
+        await self.session.flush([snapshot])
+        return snapshot
 
-    async def clear_trend_hashtags(self):
-        query = delete(TrendHashtag)
-        await self.session.execute(query)
+    async def publish_trend_snapshot(self, snapshot: TrendSnapshot):
+        # Marking the snapshot finished is the switch that makes it live,
+        # older snapshots and their rows are removed in the same transaction
+        snapshot.finished_at = dt.datetime.now()
+        self.session.add(snapshot)
+        await self.session.execute(delete(TrendSnapshot).where(TrendSnapshot.id < snapshot.id))
+        await self.commit()
 
-    async def clear_trend_songs(self):
-        query = delete(TrendSong)
-        await self.session.execute(query)
+    @staticmethod
+    def _live_trend_snapshot_id():
+        return (
+            select(TrendSnapshot.id)
+            .where(TrendSnapshot.finished_at.is_not(None))
+            .order_by(TrendSnapshot.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
 
+    @reads_replica
     async def get_trend_videos(self) -> list[TrendVideo]:
-        query = select(TrendVideo)
+        query = select(TrendVideo).where(TrendVideo.snapshot_id == self._live_trend_snapshot_id())
         return list(await self.session.scalars(query))
 
+    @reads_replica
     async def get_trend_hashtags(self) -> list[TrendHashtag]:
-        query = select(TrendHashtag)
+        query = select(TrendHashtag).where(TrendHashtag.snapshot_id == self._live_trend_snapshot_id())
         return list(await self.session.scalars(query))
 
+    @reads_replica
     async def get_trend_songs(self) -> list[TrendSong]:
-        query = select(TrendSong)
+        query = select(TrendSong).where(TrendSong.snapshot_id == self._live_trend_snapshot_id())
         return list(await self.session.scalars(query))
-
@@ -1,6 +1,8 @@
-from sqlalchemy import select
+from typing import Sequence
+from sqlalchemy import select, update, values, column, func, or_, String
 
 from .base import BaseRepository
+from app.db.replicas import reads_replica
 from app.db.tables import User
 
 
@@ -10,9 +12,11 @@ class UserRepository(BaseRepository):
     async def store(self, model: User) -> User:
         return await self._create(model)
 
+    @reads_replica
     async def get_by_nickname(self, nickname: str) -> User:
         return await self._get_one(nickname=nickname)
 
+    @reads_replica
     async def list(self) -> list[User]:
         query = select(self.base_table)
         query = query.order_by(self.base_table.id.desc())
@@ -22,3 +26,25 @@ class UserRepository(BaseRepository):
         user = await self._get_one(nickname=nickname)
         await self._update_obj(user, **fields)
 
+    async def bulk_update(self, changes: Sequence[dict], do_commit: bool = True):
+        # One UPDATE ... FROM (VALUES ...) for all users, None keeps the current
+        # value and rows without an actual change are not touched
+        if changes:
+            rows = values(
+                column("nickname", String),
+                column("avatar", String),
+                column("error", String),
+                name="changes",
+            ).data([(row["nickname"], row.get("avatar"), row.get("error")) for row in changes])
+            avatar = func.coalesce(rows.c.avatar, User.avatar)
+            error = func.coalesce(rows.c.error, User.error)
+            query = (
+                update(User)
+                .where(User.nickname == rows.c.nickname)
+                .where(or_(User.avatar.is_distinct_from(avatar), User.error.is_distinct_from(error)))
+                .values(avatar=avatar, error=error)
+                .execution_options(synchronize_session=False)
+            )
+            await self.session.execute(query)
+        if do_commit:
+            await self.commit()
@@ -0,0 +1,104 @@
+import datetime as dt
+import time
+
+from loguru import logger
+from pydantic_settings import BaseSettings
+from redis.asyncio import Redis
+
+from app.db.redis import pool
+
+
+class VideoDeltaSettings(BaseSettings):
+    # "redis" shares last counters between workers, "memory" keeps them per process, "off" stores every row
+    video_delta_store: str = "redis"
+    # Unchanged videos are stored again after this many days, so the latest row of a video
+    # is never older than that and reads can skip older partitions
+    video_delta_max_age_days: int = 7
+    # Longest gap between two scrapes of a user: SCHEDULER_MAX_INTERVAL_HOURS plus slack for failed runs
+    video_delta_refresh_gap_days: int = 5
+    # Videos kept by the "memory" store, the least recently stored are dropped first
+    video_delta_memory_size: int = 100_000
+
+
+class VideoDeltaRepository:
+    # Last stored counters of every video, used to skip snapshot rows that did not change.
+    # Redis keys expire after max age, when the row has to be stored again anyway
+    key_prefix = "video_stats:last:"
+    memory: dict[str, str] = {}
+    settings = VideoDeltaSettings()
+
+    # The latest row of a video is at most this old: it is stored again at the
+    # first scrape after max age, which can come up to a refresh gap later
+    carry_forward = dt.timedelta(days=settings.video_delta_max_age_days + settings.video_delta_refresh_gap_days)
+
+    def __init__(self):
+        self.redis = None
+        if self.settings.video_delta_store == "redis":
+            self.redis = Redis(connection_pool=pool)
+
+    @staticmethod
+    def _counters(row: dict) -> str:
+        return f'{row["views"]}:{row["comments"]}:{row["diggs"]}:{row["shares"]}'
+
+    def _is_fresh(self, row: dict, last: str | None) -> bool:
+        if last is None:
+            return False
+        counters, _, stored_at = last.partition("@")
+        if counters != self._counters(row) or not stored_at:
+            return False
+        return time.time() - float(stored_at) < self.settings.video_delta_max_age_days * 86400
+
+    def _remember_memory(self, mapping: dict[str, str], now: int):
+        # Insertion order is storage order, so expired and least recently
+        # stored videos are both at the front
+        for video_id, value in mapping.items():
+            self.memory.pop(video_id, None)
+            self.memory[video_id] = value
+        expired_at = now - self.settings.video_delta_max_age_days * 86400
+        while self.memory:
+            video_id, value = next(iter(self.memory.items()))
+            full = len(self.memory) > self.settings.video_delta_memory_size
+            if not full and float(value.partition("@")[2]) >= expired_at:
+                break
+            del self.memory[video_id]
+
+    async def filter_changed(self, rows: list[dict]) -> list[dict]:
+        if self.settings.video_delta_store == "off" or not rows:
+            return rows
+        video_ids = [row["video_id"] for row in rows]
+        if self.redis is None:
+            last = [self.memory.get(video_id) for video_id in video_ids]
+        else:
+            try:
+                last = await self.redis.mget([self.key_prefix + video_id for video_id in video_ids])
+            except Exception as e:
+                logger.warning(f"Video delta lookup failed, storing all rows: {e!r}")
+                return rows
+        return [row for row, counters in zip(rows, last) if not self._is_fresh(row, counters)]
+
+    async def forget(self, video_ids: list[str]):
+        # The next scrape of these videos is stored whether it changed or not
+        if self.settings.video_delta_store == "off" or not video_ids:
+            return
+        if self.redis is None:
+            for video_id in video_ids:
+                self.memory.pop(video_id, None)
+            return
+        await self.redis.delete(*[self.key_prefix + video_id for video_id in video_ids])
+
+    async def remember(self, rows: list[dict]):
+        # Called only after the rows are committed, so a failed write is retried next time
+        if self.settings.video_delta_store == "off" or not rows:
+            return
+        now = int(time.time())
+        mapping = {row["video_id"]: f"{self._counters(row)}@{now}" for row in rows}
+        if self.redis is None:
+            self._remember_memory(mapping, now)
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for video_id, value in mapping.items():
+                    pipe.set(self.key_prefix + video_id, value, ex=self.settings.video_delta_max_age_days * 86400)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Video delta update failed: {e!r}")
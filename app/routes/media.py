@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, Header, Query, Response
+from fastapi.responses import FileResponse
+
+from app.services.media import MediaService
+
+router = APIRouter(prefix="/api/media", tags=["Media"])
+
+
+# Without an api token, so that clients can use the urls directly in image
+# and video views. Objects are only reachable by their content hash.
+@router.get("/{sha256}")
+async def get_media(
+        sha256: str,
+        width: int | None = Query(None),
+        if_none_match: str | None = Header(None),
+        service: MediaService = Depends()
+):
+    path, content_type = await service.get_file(sha256, width)
+    etag = f'"{path.name}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    # FileResponse answers Range requests with 206 partial content
+    return FileResponse(path, media_type=content_type, headers=headers)
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Query, Depends
+from fastapi import APIRouter, Query, Depends, status
 
 from . import validate_api_token
 from app.services.stats import StatsService
-from app.schemas.stats import StatsUserSchema, StatsSchema
+from app.schemas.stats import StatsUserSchema, StatsSchema, ScrapeRunSchema
 from app.schemas.stats import StatsTrendVideoSchema, StatsTrendHashtagSchema, StatsTrendSongSchema
+from app.schemas.external import ExternalLimiterSchema
 
 router = APIRouter(prefix="/api/stats", tags=["Stats"])
 
@@ -65,3 +66,37 @@ async def get_trend_songs(
 ):
     return await service.get_trend_songs()
 
+
+@router.get(
+    "/external/limiter",
+    response_model=ExternalLimiterSchema,
+    dependencies=[Depends(validate_api_token)]
+)
+async def get_external_limiter(
+        service: StatsService = Depends()
+):
+    return await service.get_external_limiter()
+
+
+@router.get(
+    "/external/runs/{kind}/latest",
+    response_model=ScrapeRunSchema,
+    dependencies=[Depends(validate_api_token)]
+)
+async def get_latest_run(
+        kind: str,
+        service: StatsService = Depends()
+):
+    return await service.get_latest_run(kind)
+
+
+@router.delete(
+    "/external/runs/{run_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(validate_api_token)]
+)
+async def delete_run(
+        run_id: int,
+        service: StatsService = Depends()
+):
+    await service.delete_run(run_id)
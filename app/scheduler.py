@@ -0,0 +1,101 @@
+import asyncio
+from loguru import logger
+from pydantic_settings import BaseSettings
+
+from app.repositories.external import ApifyClient
+from app.repositories.leader import LeaderLock
+from app.repositories.queue import JobQueue, QueueSettings
+from app.services.scheduler import RefreshScheduler
+from app.services.stats import StatsService
+
+
+class SchedulerProcessSettings(BaseSettings):
+    trends_interval_hours: float = 12
+    partitions_interval_hours: float = 24
+
+
+async def update_trend_stats():
+    if QueueSettings().queue_enabled:
+        await JobQueue().enqueue("trends", {})
+    else:
+        await StatsService.update_trends()
+
+
+async def maintain_stats_partitions():
+    await StatsService.maintain_partitions()
+
+
+async def repeat(job, hours: float):
+    while True:
+        try:
+            await job()
+        except Exception as e:
+            logger.exception(e)
+        await asyncio.sleep(hours * 60 * 60)
+
+
+class SchedulerProcess:
+    # Any number of these can run, the one holding the Redis lock schedules
+    # refreshes and maintenance while the others wait to take over
+
+    def __init__(self, settings: SchedulerProcessSettings | None = None, lock: LeaderLock | None = None):
+        self.settings = settings or SchedulerProcessSettings()
+        self.lock = lock or LeaderLock()
+
+    async def _keep_lock(self):
+        while True:
+            await asyncio.sleep(self.lock.settings.leader_lock_renew_interval)
+            try:
+                renewed = await self.lock.renew()
+            except Exception as e:
+                # Redis is unreachable, the lock may expire and be taken by another process
+                logger.exception(e)
+                renewed = False
+            if not renewed:
+                logger.warning("Lost the scheduler lock")
+                return
+
+    async def lead(self):
+        # Returns when leadership is lost, the jobs are cancelled with it
+        logger.info(f"Scheduler {self.lock.token} is the leader")
+        tasks = [
+            asyncio.create_task(repeat(maintain_stats_partitions, self.settings.partitions_interval_hours)),
+            asyncio.create_task(repeat(update_trend_stats, self.settings.trends_interval_hours)),
+            asyncio.create_task(RefreshScheduler().run()),
+        ]
+        try:
+            await self._keep_lock()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self):
+        await ApifyClient.open()
+        try:
+            while True:
+                try:
+                    acquired = await self.lock.acquire()
+                except Exception as e:
+                    logger.exception(e)
+                    acquired = False
+                if acquired:
+                    try:
+                        await self.lead()
+                    finally:
+                        try:
+                            await self.lock.release()
+                        except Exception as e:
+                            logger.exception(e)
+                else:
+                    await asyncio.sleep(self.lock.settings.leader_lock_renew_interval)
+        finally:
+            await ApifyClient.close()
+
+
+def run():
+    asyncio.run(SchedulerProcess().run())
+
+
+if __name__ == '__main__':
+    run()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, model_validator, AliasChoices, Field
+from pydantic import BaseModel, model_validator, AliasChoices, AliasPath, Field, TypeAdapter
 
 
 class ExternalVideoDataSchema(BaseModel):
@@ -37,34 +37,26 @@ class ExternalVideoDataSchema(BaseModel):
         return state
 
 
-class ExternalDataSchema(BaseModel):
-    class Data(BaseModel):
-        class Stats(BaseModel):
-            followerCount: int
-            followingCount: int
-            heartCount: int
-            videoCount: int
-            diggCount: int
-
-        class User(BaseModel):
-            avatarMedium: str
-            uniqueId: str
-
-        user: User
-        stats: Stats
-
-        @model_validator(mode="before")
-        @classmethod
-        def strip_keys(cls, state) -> dict:
-            if not isinstance(state, dict):
-                return state
-            for key, value in state.items():
-                if isinstance(key, str):
-                    key = key.strip(' ')
-                state[key] = value
-            return state
+class ExternalVideoStatsRow(BaseModel):
+    # Profile scraper item projected straight onto the snapshot columns
+    video_id: str | None = Field(None, validation_alias="id")
+    views: int | None = Field(None, validation_alias="playCount")
+    comments: int | None = Field(None, validation_alias="commentCount")
+    diggs: int | None = Field(None, validation_alias="diggCount")
+    shares: int | None = Field(None, validation_alias="shareCount")
+    cover_url: str | None = Field(None, validation_alias=AliasPath("videoMeta", "originalCoverUrl"))
+    video_url: str = Field("", validation_alias=AliasPath("mediaUrls", 0))
+    # Error items only carry the requested profile as input
+    nickname: str = Field("", validation_alias=AliasChoices(AliasPath("authorMeta", "name"), "input"))
+    avatar: str = Field("", validation_alias=AliasPath("authorMeta", "avatar"))
+    followers: int = Field(0, validation_alias=AliasPath("authorMeta", "fans"))
+    following: int = Field(0, validation_alias=AliasPath("authorMeta", "following"))
+    likes: int = Field(0, validation_alias=AliasPath("authorMeta", "heart"))
+    user_diggs: int = Field(0, validation_alias=AliasPath("authorMeta", "digg"))
+    error: str | None = None
 
-    userInfo: Data
+
+ExternalVideoStatsRows = TypeAdapter(list[ExternalVideoStatsRow])
 
 
 class ExternalTrendVideoDataSchema(BaseModel):
@@ -97,3 +89,9 @@ class ExternalTrendSongDataSchema(BaseModel):
     author: str
     rank: int
 
+
+class ExternalLimiterSchema(BaseModel):
+    limit: int
+    in_flight: int
+    waiting: int
+    average_latency: float | None = None
@@ -57,3 +57,19 @@ class StatsTrendSongSchema(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+
+class ScrapeRunSchema(BaseModel):
+    id: int
+    kind: str
+    actor: str
+    status: str
+    started_at: dt.datetime
+    finished_at: dt.datetime | None
+    requested: int
+    fetched_rows: int
+    user_rows: int
+    video_rows: int
+    store_seconds: float
+    error: str | None
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,74 @@
+import asyncio
+from loguru import logger
+from pydantic_settings import BaseSettings
+
+from app.repositories.queue import JobQueue, QueueSettings
+from app.repositories.signup import SignupRepository
+
+
+class BatcherSettings(BaseSettings):
+    signup_batch_window: float = 5
+    signup_batch_max_size: int = 100
+
+
+class StatsLoadBatcher:
+    # Coalesces on-signup stats loads into one job per window. Scrapes never
+    # run in the web process: without the queue the scheduler picks them up
+
+    def __init__(self, settings: BatcherSettings | None = None):
+        self.settings = settings or BatcherSettings()
+        self._pending: dict[str, None] = {}
+        self._in_flight: set[str] = set()
+        self._timer: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def add(self, nickname: str):
+        if nickname in self._pending or nickname in self._in_flight:
+            return
+        self._pending[nickname] = None
+        if len(self._pending) >= self.settings.signup_batch_max_size:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._spawn(self.flush())
+        elif self._timer is None:
+            self._timer = self._spawn(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.settings.signup_batch_window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        nicknames = list(self._pending)
+        self._pending.clear()
+        if not nicknames:
+            return
+        logger.debug(f"Loading stats for {len(nicknames)} new users")
+        self._in_flight.update(nicknames)
+        try:
+            if QueueSettings().queue_enabled:
+                await JobQueue().enqueue("profiles", {"nicknames": nicknames})
+            else:
+                await SignupRepository().add(nicknames)
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            self._in_flight.difference_update(nicknames)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+stats_load_batcher = StatsLoadBatcher()
@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from io import BytesIO
+from pathlib import Path
+
+from aiohttp import ClientSession, ClientTimeout
+from fastapi import Depends, HTTPException
+from loguru import logger
+from PIL import Image
+from pydantic_settings import BaseSettings
+
+from app.repositories.media import MediaRepository
+from app.repositories.queue import JobQueue, QueueSettings
+from app.db.tables import MediaObject
+
+
+class MediaSettings(BaseSettings):
+    media_mirror_enabled: bool = False
+    media_mirror_videos: bool = False
+    media_root: str = "media"
+    # Prefix of mirrored urls returned by the API, e.g. https://api.example.com
+    media_base_url: str = ""
+    media_max_size_mb: int = 100
+    media_fetch_concurrency: int = 8
+    media_fetch_timeout: float = 60
+    media_thumbnail_cache_mb: int = 512
+    media_thumbnail_widths: list[int] = [120, 320, 720]
+
+
+settings = MediaSettings()
+
+
+class ThumbnailCache:
+    # Resized variants on disk, evicted least recently used first. The
+    # directory is shared by every worker, so the mtime of the files is the
+    # recency index and the size bound is checked against the directory itself.
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _get(self, name: str) -> Path | None:
+        path = self.root / name
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _put(self, name: str, data: bytes) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / name
+        tmp_path = self.root / f".{uuid.uuid4().hex}"
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        self._evict(keep=name)
+        return path
+
+    def _evict(self, keep: str):
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Evicted by another worker in the meantime
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, name in sorted(files):
+            if size <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            (self.root / name).unlink(missing_ok=True)
+            size -= file_size
+
+    async def get(self, name: str) -> Path | None:
+        return await asyncio.to_thread(self._get, name)
+
+    async def put(self, name: str, data: bytes) -> Path:
+        return await asyncio.to_thread(self._put, name, data)
+
+
+thumbnail_cache = ThumbnailCache(Path(settings.media_root) / "thumbs", settings.media_thumbnail_cache_mb * 1024 * 1024)
+
+
+class MediaService:
+    # Shared by every mirror call of the process, so concurrent batches do not multiply downloads
+    download_slots = asyncio.Semaphore(settings.media_fetch_concurrency)
+    _tasks: set[asyncio.Task] = set()
+
+    def __init__(
+            self,
+            media_repository: MediaRepository = Depends()
+    ):
+        self.media_repository = media_repository
+
+    @staticmethod
+    def object_path(sha256: str) -> Path:
+        return Path(settings.media_root) / "objects" / sha256[:2] / sha256
+
+    @staticmethod
+    def media_url(model: MediaObject) -> str:
+        return f"{settings.media_base_url}/api/media/{model.sha256}"
+
+    @staticmethod
+    def _store_object(tmp_path: Path, path: Path):
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, path)
+
+    async def _download(self, session: ClientSession, url: str) -> dict | None:
+        max_size = settings.media_max_size_mb * 1024 * 1024
+        async with session.get(url) as resp:
+            if resp.status != 200 or (resp.content_length or 0) > max_size:
+                logger.debug(f"Skip mirroring {url}: {resp.status}")
+                return None
+            tmp_dir = Path(settings.media_root) / "tmp"
+            tmp_path = tmp_dir / uuid.uuid4().hex
+            hasher = hashlib.sha256()
+            size = 0
+            # File operations run in threads, so other downloads and jobs keep running
+            await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+            file = await asyncio.to_thread(open, tmp_path, "wb")
+            try:
+                try:
+                    async for chunk in resp.content.iter_chunked(64 * 1024):
+                        size += len(chunk)
+                        if size > max_size:
+                            return None
+                        hasher.update(chunk)
+                        await asyncio.to_thread(file.write, chunk)
+                finally:
+                    await asyncio.to_thread(file.close)
+                sha256 = hasher.hexdigest()
+                # Identical content from another url or snapshot is stored once
+                await asyncio.to_thread(self._store_object, tmp_path, self.object_path(sha256))
+            finally:
+                await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+        return {
+            "source_url_hash": MediaRepository.url_hash(url),
+            "source_url": url,
+            "sha256": sha256,
+            "content_type": resp.content_type,
+            "size": size,
+        }
+
+    @classmethod
+    async def schedule_mirror(cls, urls: list[str]):
+        # Mirroring runs off the refresh path, so slow CDNs do not eat the
+        # refresh budget: on a worker when the queue is enabled, otherwise
+        # in a background task of this process
+        urls = list({url for url in urls if url})
+        if not settings.media_mirror_enabled or not urls:
+            return
+        if QueueSettings().queue_enabled:
+            await JobQueue().enqueue("media", {"urls": urls})
+            return
+        task = asyncio.create_task(cls._mirror_in_background(urls))
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+
+    @classmethod
+    async def _mirror_in_background(cls, urls: list[str]):
+        try:
+            await cls.mirror(urls)
+        except Exception as e:
+            logger.exception(e)
+
+    @classmethod
+    async def mirror(cls, urls: list[str]):
+        urls = list({url for url in urls if url})
+        if not settings.media_mirror_enabled or not urls:
+            return
+        # The lookup and the store get their own sessions, no connection is
+        # held while the files download
+        async with MediaRepository() as media_repository:
+            known = await media_repository.get_by_urls(urls)
+        urls = [url for url in urls if url not in known]
+        if not urls:
+            return
+        self = cls(media_repository=MediaRepository())
+
+        async def download(url: str) -> dict | None:
+            async with cls.download_slots:
+                try:
+                    return await self._download(session, url)
+                except Exception as e:
+                    logger.warning(f"Failed to mirror {url}: {e!r}")
+
+        async with ClientSession(timeout=ClientTimeout(total=settings.media_fetch_timeout)) as session:
+            rows = await asyncio.gather(*[download(url) for url in urls])
+        rows = [row for row in rows if row is not None]
+        async with self.media_repository:
+            await self.media_repository.bulk_store(rows)
+        logger.debug(f"Mirrored {len(rows)} of {len(urls)} media files")
+
+    async def get_mirrored_urls(self, urls: list[str]) -> dict[str, str]:
+        if not settings.media_mirror_enabled:
+            return {}
+        models = await self.media_repository.get_by_urls([url for url in urls if url])
+        return {url: self.media_url(model) for url, model in models.items()}
+
+    async def get_file(self, sha256: str, width: int | None = None) -> tuple[Path, str]:
+        model = await self.media_repository.get_by_sha256(sha256)
+        path = self.object_path(sha256)
+        if not path.exists():
+            raise HTTPException(404)
+        if width is None or not model.content_type.startswith("image/"):
+            return path, model.content_type
+        if width not in settings.media_thumbnail_widths:
+            raise HTTPException(400, detail=f"Width must be one of {settings.media_thumbnail_widths}")
+
+        name = f"{sha256}_{width}.jpg"
+        thumbnail = await thumbnail_cache.get(name)
+        if thumbnail is None:
+            data = await asyncio.to_thread(self._resize, path, width)
+            thumbnail = await thumbnail_cache.put(name, data)
+        return thumbnail, "image/jpeg"
+
+    @staticmethod
+    def _resize(path: Path, width: int) -> bytes:
+        with Image.open(path) as image:
+            image = image.convert("RGB")
+            if image.width > width:
+                image = image.resize((width, round(image.height * width / image.width)))
+            output = BytesIO()
+            image.save(output, format="JPEG", quality=85)
+        return output.getvalue()
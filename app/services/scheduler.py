@@ -0,0 +1,137 @@
+import asyncio
+import datetime as dt
+import heapq
+from loguru import logger
+from pydantic_settings import BaseSettings
+
+from app.repositories.external import ApifyClient, ExternalRepository
+from app.repositories.queue import JobQueue, QueueSettings
+from app.repositories.signup import SignupRepository
+from app.repositories.stats import StatsRepository
+from app.repositories.user import UserRepository
+from app.services.stats import StatsService
+
+
+class SchedulerSettings(BaseSettings):
+    scheduler_min_interval_hours: float = 2
+    scheduler_max_interval_hours: float = 48
+    scheduler_window_days: int = 3
+    # Growth at which a user is refreshed twice as often as a dormant one
+    scheduler_target_follower_growth: float = 0.01  # share of followers per day
+    scheduler_target_view_velocity: float = 1000  # views per hour
+    scheduler_batch_size: int = 100
+    scheduler_tick_seconds: float = 60
+
+
+class RefreshScheduler:
+    def __init__(self, settings: SchedulerSettings | None = None):
+        self.settings = settings or SchedulerSettings()
+        self.queue = JobQueue() if QueueSettings().queue_enabled else None
+        self.signups = SignupRepository()
+        self._queue: list[tuple[dt.datetime, str]] = []
+        self._due: dict[str, dt.datetime] = {}
+
+    @property
+    def batch_size(self) -> int:
+        if self.queue is not None:
+            return self.settings.scheduler_batch_size
+        # One update_users call scrapes the whole batch, give it a chunk for
+        # every actor run the adaptive limiter currently allows
+        in_flight = ExternalRepository.video_chunk_size * int(ApifyClient.limiter.limit)
+        return max(self.settings.scheduler_batch_size, in_flight)
+
+    @property
+    def min_interval(self) -> dt.timedelta:
+        return dt.timedelta(hours=self.settings.scheduler_min_interval_hours)
+
+    def interval(self, growth: dict) -> dt.timedelta:
+        hours = max((growth["last_at"] - growth["first_at"]).total_seconds() / 3600, 1)
+        follower_growth = (growth["max_followers"] - growth["min_followers"]) / max(growth["max_followers"], 1) / (hours / 24)
+        view_velocity = growth["views"] / hours
+        score = (
+            follower_growth / self.settings.scheduler_target_follower_growth
+            + view_velocity / self.settings.scheduler_target_view_velocity
+        )
+        interval = self.settings.scheduler_max_interval_hours / (1 + score)
+        interval = max(interval, self.settings.scheduler_min_interval_hours)
+        return dt.timedelta(hours=interval)
+
+    def _push(self, nickname: str, due_at: dt.datetime):
+        self._due[nickname] = due_at
+        heapq.heappush(self._queue, (due_at, nickname))
+
+    async def _schedule(self, nicknames: list[str], earliest: dt.datetime | None = None):
+        since = dt.datetime.now() - dt.timedelta(days=self.settings.scheduler_window_days)
+        async with StatsRepository() as stats_repository:
+            growth = await stats_repository.get_growth(since, nicknames)
+        for nickname in nicknames:
+            # Users without recent history are due right away
+            due_at = since
+            if nickname in growth:
+                due_at = growth[nickname]["last_at"] + self.interval(growth[nickname])
+            if earliest is not None:
+                due_at = max(due_at, earliest)
+            self._push(nickname, due_at)
+
+    async def _sync_users(self):
+        async with UserRepository() as user_repository:
+            users = await user_repository.list()
+        active = {user.nickname: user for user in users if user.error is None}
+        for nickname in set(self._due) - set(active):
+            del self._due[nickname]
+        # Signups handed over by the web process are due right away
+        now = dt.datetime.now()
+        for nickname in await self.signups.pop(self.batch_size):
+            if nickname in active:
+                self._push(nickname, now)
+        new = [nickname for nickname in active if nickname not in self._due]
+        if not new:
+            return
+        # Fresh signups are loaded through the signup batcher, give it a head start
+        utcnow = dt.datetime.now(dt.UTC).replace(tzinfo=None)
+        signups = [nickname for nickname in new if utcnow - active[nickname].created_at < self.min_interval]
+        if signups:
+            await self._schedule(signups, earliest=dt.datetime.now() + self.min_interval)
+        others = [nickname for nickname in new if nickname not in signups]
+        if others:
+            await self._schedule(others)
+
+    def _pop_due(self, now: dt.datetime, limit: int) -> list[str]:
+        batch = []
+        while self._queue and len(batch) < limit:
+            due_at, nickname = self._queue[0]
+            if due_at > now:
+                break
+            heapq.heappop(self._queue)
+            # Skip entries superseded by a later push or removed users
+            if self._due.get(nickname) != due_at:
+                continue
+            batch.append(nickname)
+        return batch
+
+    async def tick(self):
+        await self._sync_users()
+        now = dt.datetime.now()
+        batch = self._pop_due(now, self.batch_size)
+        if not batch:
+            return
+        logger.info(f"Refreshing {len(batch)} users, {len(self._due) - len(batch)} waiting")
+        if self.queue is not None:
+            size = ExternalRepository.video_chunk_size
+            for i in range(0, len(batch), size):
+                await self.queue.enqueue("profiles", {"nicknames": batch[i:i + size]})
+        else:
+            try:
+                await StatsService.update_users(batch)
+            except Exception as e:
+                logger.exception(e)
+        # A failed scrape must not make the user due again immediately
+        await self._schedule(batch, earliest=now + self.min_interval)
+
+    async def run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.exception(e)
+            await asyncio.sleep(self.settings.scheduler_tick_seconds)
@@ -1,42 +1,73 @@
 from fastapi import Depends, HTTPException
 import asyncio
 import datetime as dt
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Self
 from loguru import logger
 
-from app.repositories.external import ExternalRepository
+from app.repositories.external import ApifyClient, ExternalRepository
 from app.repositories.stats import StatsRepository
 from app.repositories.user import UserRepository
-from app.schemas.stats import StatsUserSchema, StatsSchema
+from app.repositories.video_delta import VideoDeltaRepository
+from app.repositories.media import MediaRepository
+from app.repositories.partition import PartitionRepository
+from app.repositories.scrape_run import ScrapeRunRepository
+from app.services.media import MediaService
+from app.services.media import settings as media_settings
+from app.schemas.stats import StatsSchema, ScrapeRunSchema
 from app.schemas.stats import (
     StatsTrendVideoSchema,
     StatsTrendHashtagSchema,
     StatsTrendSongSchema,
 )
-from app.schemas.external import ExternalDataSchema, ExternalVideoDataSchema
-from app.db.base import get_session
-from app.db.tables import UserStats, VideoStats, TrendVideo, TrendHashtag, TrendSong
+from app.schemas.external import ExternalLimiterSchema
+from app.schemas.external import ExternalVideoStatsRow
+from app.schemas.external import (
+    ExternalTrendVideoDataSchema,
+    ExternalTrendHashtagDataSchema,
+    ExternalTrendSongDataSchema,
+)
+from app.db.base import ingest_session
+from app.db.tables import TrendVideo, TrendHashtag, TrendSong, ScrapeRun
 
 
 class StatsService:
+    video_stats_fields = {"video_id", "views", "comments", "diggs", "shares", "nickname", "cover_url", "video_url"}
+
     def __init__(
         self,
         external_repository: ExternalRepository = Depends(),
         stats_repository: StatsRepository = Depends(),
         user_repository: UserRepository = Depends(),
+        video_delta_repository: VideoDeltaRepository = Depends(),
+        media_service: MediaService = Depends(),
+        scrape_run_repository: ScrapeRunRepository = Depends(),
     ):
         self.external_repository = external_repository
         self.stats_repository = stats_repository
         self.user_repository = user_repository
+        self.video_delta_repository = video_delta_repository
+        self.media_service = media_service
+        self.scrape_run_repository = scrape_run_repository
+
+    async def _with_mirrored_urls(self, schema: StatsSchema) -> StatsSchema:
+        urls = [video.cover_url for video in schema.video_stats] + [video.video_url for video in schema.video_stats]
+        mirrored = await self.media_service.get_mirrored_urls(urls)
+        for video in schema.video_stats:
+            video.cover_url = mirrored.get(video.cover_url, video.cover_url)
+            video.video_url = mirrored.get(video.video_url, video.video_url)
+        return schema
 
     async def get_current(self, nickname: str) -> StatsSchema:
         stats = await self.stats_repository.get_latest(nickname)
         if stats is None:
             raise HTTPException(404)
-        return StatsSchema.model_validate(stats)
+        return await self._with_mirrored_urls(StatsSchema.model_validate(stats))
 
     async def get_increase(self, nickname: str, days: int) -> StatsSchema:
         stats = await self.stats_repository.get_increase(nickname, days)
-        return StatsSchema.model_validate(stats)
+        return await self._with_mirrored_urls(StatsSchema.model_validate(stats))
 
     async def get_trend_videos(self) -> list[StatsTrendVideoSchema]:
         models = await self.stats_repository.get_trend_videos()
@@ -50,59 +81,126 @@ class StatsService:
         models = await self.stats_repository.get_trend_songs()
         return [StatsTrendSongSchema.model_validate(model) for model in models]
 
+    async def get_external_limiter(self) -> ExternalLimiterSchema:
+        return ExternalLimiterSchema.model_validate(ApifyClient.limiter.stats())
+
+    async def get_latest_run(self, kind: str) -> ScrapeRunSchema:
+        run = await self.scrape_run_repository.get_latest_complete(kind)
+        if run is None:
+            raise HTTPException(404)
+        return ScrapeRunSchema.model_validate(run)
+
+    async def delete_run(self, run_id: int):
+        # Rollups, latest_stats and archives are not rewound, so only the last
+        # run of a kind can go, and only while its rows are not compacted
+        run = await self.scrape_run_repository.get(run_id)
+        if run is None:
+            raise HTTPException(404)
+        if run.status == "running" or not await self.scrape_run_repository.is_latest(run):
+            raise HTTPException(409, detail="Only the latest finished run of a kind can be deleted")
+        compaction_age = PartitionRepository.settings.stats_compaction_age_days
+        if compaction_age and run.started_at < dt.datetime.now() - dt.timedelta(days=compaction_age):
+            raise HTTPException(409, detail="The run is already compacted")
+        video_ids = await self.stats_repository.get_run_video_ids(run_id)
+        await self.scrape_run_repository.delete_run(run_id)
+        # Unchanged videos of the next scrape must be stored again
+        await self.video_delta_repository.forget(video_ids)
+
     async def _save_user_stats(
         self,
-        schema: ExternalVideoDataSchema.AuthorMeta,
-        error: str | None,
+        authors: dict[str, dict],
         created_at: dt.datetime,
+        run: ScrapeRun,
     ):
-        if error:
-            await self.user_repository.update(schema.name, error=error)
-            return
-        user_stats = UserStats(
-            followers=schema.fans,
-            following=schema.following,
-            likes=schema.heart,
-            diggs=schema.digg,
-            nickname=schema.name,
-            created_at=created_at,
-        )
-        logger.debug(schema.avatar)
-        await self.stats_repository.store_user(user_stats)
-        await self.user_repository.update(schema.name, avatar=schema.avatar)
+        started = time.perf_counter()
+        rows = [author["row"] for author in authors.values()]
+        stats_rows = [
+            {
+                "followers": row.followers,
+                "following": row.following,
+                "likes": row.likes,
+                "diggs": row.user_diggs,
+                "nickname": row.nickname,
+                "video_ids": authors[row.nickname]["video_ids"],
+                "run_id": run.id,
+                "created_at": created_at,
+            }
+            for row in rows
+            if not row.error
+        ]
+        changes = [
+            {
+                "nickname": row.nickname,
+                "avatar": None if row.error else row.avatar,
+                "error": row.error or None,
+            }
+            for row in rows
+        ]
+        run.user_rows += len(stats_rows)
+        # Snapshots, rollups, latest rows and user changes commit together in bulk_update
+        await self.stats_repository.bulk_store_users(stats_rows, do_commit=False)
+        await self.stats_repository.store_user_rollups(stats_rows, do_commit=False)
+        await self.stats_repository.store_latest_users(stats_rows, do_commit=False)
+        await self.user_repository.bulk_update(changes)
+        run.store_seconds += time.perf_counter() - started
 
     async def _load_video_stats(
-        self, schemas: list[ExternalVideoDataSchema], created_at: dt.datetime
+        self, data: list[ExternalVideoStatsRow], created_at: dt.datetime, run: ScrapeRun
     ):
-        videos = [
-            VideoStats(
-                video_id=schema.id,
-                views=schema.playCount,
-                comments=schema.commentCount,
-                diggs=schema.diggCount,
-                shares=schema.shareCount,
-                nickname=schema.authorMeta.name,
-                created_at=created_at,
-                cover_url=schema.videoMeta.originalCoverUrl,
-                video_url=(schema.mediaUrls[0] if schema.mediaUrls else ""),
-            )
-            for schema in schemas
-            if schema.id is not None
+        started = time.perf_counter()
+        rows = [
+            row.model_dump(include=self.video_stats_fields) | {"run_id": run.id, "created_at": created_at}
+            for row in data
+            if row.video_id is not None and row.nickname
         ]
-        [
-            await self.stats_repository.store_video(video, do_commit=False)
-            for video in videos
-        ]
-        await self.stats_repository.commit()
+        # Videos whose counters did not move since the last snapshot are not stored again
+        changed = await self.video_delta_repository.filter_changed(rows)
+        run.fetched_rows += len(data)
+        run.video_rows += len(changed)
+        await self.stats_repository.bulk_store_videos(changed, do_commit=False)
+        await self.stats_repository.store_latest_videos(changed, do_commit=False)
+        await self.stats_repository.store_video_rollups(changed)
+        await self.video_delta_repository.remember(changed)
+        run.store_seconds += time.perf_counter() - started
+        logger.debug(f"Add {len(changed)} of {len(rows)} video stats")
+
+    @staticmethod
+    def _media_urls(data: list[ExternalVideoStatsRow]) -> list[str]:
+        urls = [row.cover_url for row in data if row.cover_url]
+        if media_settings.media_mirror_videos:
+            urls += [row.video_url for row in data if row.video_url]
+        return urls
+
+    async def _save_video_data(
+        self,
+        authors: dict[str, dict],
+        nicknames: set[str],
+        data: list[ExternalVideoStatsRow],
+        created_at: dt.datetime,
+        run: ScrapeRun,
+    ):
+        # Collect user data from the first video of each author and the ids
+        # of their current videos, users are stored once all batches are in
+        for row in data:
+            if row.nickname not in nicknames:
+                continue
+            author = authors.setdefault(row.nickname, {"row": row, "video_ids": []})
+            if row.video_id is not None:
+                author["video_ids"].append(row.video_id)
+
+        await self._load_video_stats(data, created_at, run)
 
-    async def _load_trend_video(self):
-        videos = await self.external_repository.get_trend_videos_data()
+    async def _load_trend_video(
+        self, videos: list[ExternalTrendVideoDataSchema], snapshot_id: int, run_id: int
+    ):
         models = [
             TrendVideo(
                 description=video.desc,
                 video_url=video.share_url,
                 cover_url=video.video.cover.url_list[0],
                 views=video.statistics.play_count,
+                snapshot_id=snapshot_id,
+                run_id=run_id,
             )
             for video in videos
         ]
@@ -110,28 +208,35 @@ class StatsService:
             await self.stats_repository.store_trend_video(model, do_commit=False)
             for model in models
         ]
-        await self.stats_repository.commit()
 
-    async def _load_trend_hashtags(self):
-        hashtags = await self.external_repository.get_trend_hashtags_data()
+    async def _load_trend_hashtags(
+        self, hashtags: list[ExternalTrendHashtagDataSchema], snapshot_id: int, run_id: int
+    ):
         models = [
-            TrendHashtag(name=hashtag.hashtag_name, views=hashtag.video_views)
+            TrendHashtag(
+                name=hashtag.hashtag_name,
+                views=hashtag.video_views,
+                snapshot_id=snapshot_id,
+                run_id=run_id,
+            )
             for hashtag in hashtags
         ]
         [
             await self.stats_repository.store_trend_hashtag(model, do_commit=False)
             for model in models
         ]
-        await self.stats_repository.commit()
 
-    async def _load_trend_songs(self):
-        songs = await self.external_repository.get_trend_songs_data()
+    async def _load_trend_songs(
+        self, songs: list[ExternalTrendSongDataSchema], snapshot_id: int, run_id: int
+    ):
         models = [
             TrendSong(
                 cover_url=song.cover,
                 song_url=song.link,
                 title=song.title,
                 author=song.author,
+                snapshot_id=snapshot_id,
+                run_id=run_id,
             )
             for song in songs
         ]
@@ -139,83 +244,100 @@ class StatsService:
             await self.stats_repository.store_trend_song(model, do_commit=False)
             for model in models
         ]
-        await self.stats_repository.commit()
+
+    async def _load_trends(self):
+        logger.info("Loading trends...")
+        external = self.external_repository
+        actors = ",".join([external.trend_video_actor, external.trend_hashtag_actor, external.trend_song_actor])
+        try:
+            async with self.scrape_run_repository.track("trends", actors) as run:
+                videos, hashtags, songs = await asyncio.gather(
+                    external.get_trend_videos_data(),
+                    external.get_trend_hashtags_data(),
+                    external.get_trend_songs_data(),
+                )
+                run.fetched_rows = len(videos) + len(hashtags) + len(songs)
+                started = time.perf_counter()
+                async with self.ingestion() as phase:
+                    snapshot = await phase.stats_repository.create_trend_snapshot()
+                    await phase._load_trend_video(videos, snapshot.id, run.id)
+                    await phase._load_trend_hashtags(hashtags, snapshot.id, run.id)
+                    await phase._load_trend_songs(songs, snapshot.id, run.id)
+                    await phase.stats_repository.publish_trend_snapshot(snapshot)
+                run.store_seconds = time.perf_counter() - started
+        except Exception:
+            # Raised on, so that a queued job is retried
+            logger.warning("Trend refresh failed, keeping the previous snapshot")
+            raise
+        logger.info(f"Trend snapshot {snapshot.id} is live")
 
     @classmethod
-    async def load_user_stats(cls, nickname: str):
-        session_getter = get_session()
-        db_session = await anext(session_getter)
-        self = cls(
-            external_repository=ExternalRepository(),
-            stats_repository=StatsRepository(session=db_session),
-            user_repository=UserRepository(session=db_session),
-        )
-        now = dt.datetime.now()
+    @asynccontextmanager
+    async def ingestion(cls) -> AsyncIterator[Self]:
+        # A service on a short-lived session from the ingestion pool, opened for
+        # one phase of a refresh so no connection is held while Apify runs
+        async with ingest_session() as db_session:
+            yield cls(
+                external_repository=ExternalRepository(),
+                stats_repository=StatsRepository(session=db_session),
+                user_repository=UserRepository(session=db_session),
+                video_delta_repository=VideoDeltaRepository(),
+                media_service=MediaService(media_repository=MediaRepository(session=db_session)),
+                scrape_run_repository=ScrapeRunRepository(session=db_session),
+            )
 
-        data = await self.external_repository.get_video_data([nickname])
+    async def _save_video_batch(
+        self,
+        authors: dict[str, dict],
+        nicknames: set[str],
+        data: list[ExternalVideoStatsRow],
+        created_at: dt.datetime,
+        run: ScrapeRun,
+    ):
+        async with self.ingestion() as phase:
+            await phase._save_video_data(authors, nicknames, data, created_at, run)
 
-        # Extract user data from video author
-        for schema in data:
-            if schema.authorMeta is None or schema.authorMeta.name != nickname:
-                continue
-            await self._save_user_stats(schema.authorMeta, schema.error, now)
-            break
+    async def _save_user_batch(self, authors: dict[str, dict], created_at: dt.datetime, run: ScrapeRun):
+        async with self.ingestion() as phase:
+            await phase._save_user_stats(authors, created_at, run)
 
-        await self._load_video_stats(data, now)
-        logger.debug(f"Add {len(data)} video stats")
+    async def _update_users(self, nicknames: list[str]):
+        now = dt.datetime.now()
+        authors = {}
+        actor = self.external_repository.profile_actor
+
+        async with self.scrape_run_repository.track("profiles", actor, len(nicknames)) as run:
+            async def save_batch(chunk: list[str], data: list[ExternalVideoStatsRow]):
+                # Every batch is saved in its own ingestion session
+                await self._save_video_batch(authors, set(chunk), data, now, run)
+                await MediaService.schedule_mirror(self._media_urls(data))
 
-    @classmethod
-    async def update_stats(cls):
-        logger.info("Update statistics started")
-        session_getter = get_session()
-        db_session = await anext(session_getter)
-        self = cls(
-            external_repository=ExternalRepository(),
-            stats_repository=StatsRepository(session=db_session),
-            user_repository=UserRepository(session=db_session),
-        )
-
-        users = await self.user_repository.list()
-        if users:
-            nicknames = [user.nickname for user in users if user.error is None]
-            now = dt.datetime.now()
-
-            data = None
             try:
-                data = await self.external_repository.get_video_data(nicknames)
+                await self.external_repository.get_video_data_chunked(nicknames, save_batch)
             except Exception as e:
                 logger.exception(e)
+            if nicknames and not authors:
+                # Not a single chunk came back, fails the run and a queued job is retried
+                raise RuntimeError(f"No profile of {len(nicknames)} was scraped")
+            await self._save_user_batch(authors, now, run)
+            await MediaService.schedule_mirror([author["row"].avatar for author in authors.values()])
+            if len(authors) < len(nicknames):
+                # Failed chunks or an exhausted budget, the run is not a complete snapshot
+                run.status = "partial"
 
-            if data is not None:
-                # Extract user data from video author
-                for nickname in nicknames:
-                    for schema in data:
-                        if (
-                            schema.authorMeta is None
-                            or schema.authorMeta.name != nickname
-                        ):
-                            continue
-                        await self._save_user_stats(
-                            schema.authorMeta, schema.error, now
-                        )
-                        break
-
-                await self._load_video_stats(data, now)
-                logger.debug(f"Add {len(data)} video stats")
-
-        await self.stats_repository.clear_trend_videos()
-        await self.stats_repository.clear_trend_hashtags()
-        await self.stats_repository.clear_trend_songs()
-        logger.info("Cleared trend data")
-        logger.info("Loading trend videos...")
-        await self._load_trend_video()
-        logger.info("Loading trend hashtags...")
-        await self._load_trend_hashtags()
-        logger.info("Loading trend songs...")
-        await self._load_trend_songs()
-
-        logger.info("Update statistics finished")
-        try:
-            await anext(session_getter)
-        except StopAsyncIteration:
-            pass
+    @classmethod
+    async def update_users(cls, nicknames: list[str]):
+        async with cls.ingestion() as self:
+            await self._update_users(nicknames)
+
+    @classmethod
+    async def update_trends(cls):
+        async with cls.ingestion() as self:
+            await self._load_trends()
+
+    @classmethod
+    async def maintain_partitions(cls):
+        async with ingest_session() as db_session:
+            partition_repository = PartitionRepository(session=db_session)
+            await partition_repository.maintain(dt.datetime.now())
+            await partition_repository.compact(dt.datetime.now())
@@ -2,6 +2,7 @@ from fastapi import Depends
 
 from app.repositories.external import ExternalRepository
 from app.repositories.user import UserRepository
+from app.services.media import MediaService
 from app.schemas.user import UserSchema
 from app.db.tables import User
 
@@ -9,9 +10,11 @@ from app.db.tables import User
 class UserService:
     def __init__(
             self,
-            user_repository: UserRepository = Depends()
+            user_repository: UserRepository = Depends(),
+            media_service: MediaService = Depends()
     ):
         self.user_repository = user_repository
+        self.media_service = media_service
 
     async def create(self, nickname: str, app_id: str, app_bundle: str) -> UserSchema:
         model = User(nickname=nickname.strip("@"), app_id=app_id, app_bundle=app_bundle)
@@ -20,5 +23,9 @@ class UserService:
 
     async def get(self, nickname: str) -> UserSchema:
         model = await self.user_repository.get_by_nickname(nickname)
-        return UserSchema.model_validate(model)
+        schema = UserSchema.model_validate(model)
+        if schema.avatar:
+            mirrored = await self.media_service.get_mirrored_urls([schema.avatar])
+            schema.avatar = mirrored.get(schema.avatar, schema.avatar)
+        return schema
 
@@ -0,0 +1,74 @@
+import asyncio
+from loguru import logger
+from pydantic_settings import BaseSettings
+
+from app.repositories.external import ApifyClient
+from app.repositories.queue import Job, JobQueue
+from app.services.media import MediaService
+from app.services.stats import StatsService
+
+
+class WorkerSettings(BaseSettings):
+    worker_concurrency: int = 1
+    worker_poll_interval: float = 1
+
+
+class Worker:
+    def __init__(self, settings: WorkerSettings | None = None, queue: JobQueue | None = None):
+        self.settings = settings or WorkerSettings()
+        self.queue = queue or JobQueue()
+
+    async def handle(self, job: Job):
+        if job.kind == "profiles":
+            await StatsService.update_users(job.payload["nicknames"])
+        elif job.kind == "trends":
+            await StatsService.update_trends()
+        elif job.kind == "media":
+            await MediaService.mirror(job.payload["urls"])
+        else:
+            raise ValueError(f"Unknown job kind {job.kind}")
+
+    async def _heartbeat(self, job: Job):
+        while True:
+            await asyncio.sleep(self.queue.settings.queue_visibility_timeout / 3)
+            await self.queue.touch(job)
+
+    async def process(self, job: Job):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self.handle(job)
+        except Exception as e:
+            logger.exception(e)
+            await self.queue.fail(job, repr(e))
+        else:
+            await self.queue.ack(job)
+        finally:
+            heartbeat.cancel()
+
+    async def consume(self):
+        while True:
+            try:
+                job = await self.queue.reserve()
+            except Exception as e:
+                logger.exception(e)
+                job = None
+            if job is None:
+                await asyncio.sleep(self.settings.worker_poll_interval)
+                continue
+            logger.info(f"Processing {job.kind} job {job.id} (attempt {job.attempts})")
+            await self.process(job)
+
+    async def run(self):
+        await ApifyClient.open()
+        try:
+            await asyncio.gather(*[self.consume() for _ in range(self.settings.worker_concurrency)])
+        finally:
+            await ApifyClient.close()
+
+
+def run():
+    asyncio.run(Worker().run())
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,62 @@
+"""Compare per-row ExternalVideoDataSchema validation with the batch decoder.
+
+    python -m benchmarks.external_schemas [rows]
+"""
+import json
+import sys
+import timeit
+
+from app.repositories.external import ExternalRepository
+from app.schemas.external import ExternalVideoDataSchema
+
+
+def make_lines(count: int) -> list[bytes]:
+    lines = []
+    for i in range(count):
+        if i % 50 == 0:
+            row = {"error": "Profile not found", "input": f"user{i}"}
+        else:
+            row = {
+                "id": str(7000000000000000000 + i),
+                "text": "caption " * 10,
+                "playCount": i * 100,
+                "commentCount": i,
+                "diggCount": i * 10,
+                "shareCount": i // 2,
+                "mediaUrls": [f"https://api.apify.com/v2/key-value-stores/store/records/video-{i}"],
+                "videoMeta": {"originalCoverUrl": f"https://p16-sign.tiktokcdn.com/{i}.jpeg", "duration": 15},
+                "authorMeta": {
+                    "name": f"user{i // 5}",
+                    "avatar": f"https://p16-sign.tiktokcdn.com/avatar-{i // 5}.jpeg",
+                    "following": 10, "friends": 1, "fans": 1000, "heart": 5000, "video": 20, "digg": 30,
+                },
+            }
+        lines.append(json.dumps(row).encode())
+    return lines
+
+
+def per_row(lines: list[bytes]) -> list[ExternalVideoDataSchema]:
+    rows = [json.loads(line) for line in lines]
+    return [
+        (ExternalVideoDataSchema.model_validate(row) if row.get('error') is None else ExternalVideoDataSchema(
+            error=row.get('error'),
+            authorMeta=ExternalVideoDataSchema.AuthorMeta(name=row.get("input", ''), avatar='')
+        ))
+        for row in rows
+    ]
+
+
+def batch(lines: list[bytes]):
+    return ExternalRepository._decode_video_rows(lines)
+
+
+def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    lines = make_lines(count)
+    for name, func in (("per-row model_validate", per_row), ("batch validate_json", batch)):
+        seconds = min(timeit.repeat(lambda: func(lines), number=1, repeat=5))
+        print(f"{name:>24}: {seconds * 1000:8.1f} ms for {count} rows ({count / seconds:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,72 @@
+"""Just enough of the Apify API for ExternalRepository, served by aiohttp.web."""
+import asyncio
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class FakeApify:
+    def __init__(self, items: list[dict], statuses: tuple[str, ...] = ("RUNNING", "SUCCEEDED"), hang: bool = False):
+        self.items = items
+        # Status returned by each poll of the run, the last one is repeated
+        self.statuses = list(statuses)
+        # Polls never answer, to cancel a caller waiting for the run
+        self.hang = hang
+        self.polled = asyncio.Event()
+        self.polls = 0
+        self.aborted: list[str] = []
+        self.page_offsets: list[int] = []
+        app = web.Application()
+        app.router.add_post("/v2/acts/{actor}/runs", self.start_run)
+        app.router.add_post("/v2/acts/{actor}/run-sync-get-dataset-items", self.run_sync)
+        app.router.add_get("/v2/actor-runs/{run_id}", self.get_run)
+        app.router.add_post("/v2/actor-runs/{run_id}/abort", self.abort_run)
+        app.router.add_get("/v2/datasets/{dataset_id}", self.get_dataset)
+        app.router.add_get("/v2/datasets/{dataset_id}/items", self.get_items)
+        self.server = TestServer(app)
+
+    async def __aenter__(self):
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.server.close()
+
+    @property
+    def url(self) -> str:
+        return str(self.server.make_url("")).rstrip("/")
+
+    @staticmethod
+    def run(status: str) -> dict:
+        return {"id": "run-1", "status": status, "defaultDatasetId": "dataset-1"}
+
+    def jsonl(self, items: list[dict]) -> web.Response:
+        return web.Response(body="".join(json.dumps(item) + "\n" for item in items), content_type="application/jsonl")
+
+    async def start_run(self, request: web.Request) -> web.Response:
+        return web.json_response({"data": self.run("READY")}, status=201)
+
+    async def run_sync(self, request: web.Request) -> web.Response:
+        return self.jsonl(self.items)
+
+    async def get_run(self, request: web.Request) -> web.Response:
+        self.polls += 1
+        self.polled.set()
+        if self.hang:
+            await asyncio.Event().wait()
+        status = self.statuses[min(self.polls, len(self.statuses)) - 1]
+        return web.json_response({"data": self.run(status)})
+
+    async def abort_run(self, request: web.Request) -> web.Response:
+        self.aborted.append(request.match_info["run_id"])
+        return web.json_response({"data": self.run("ABORTED")})
+
+    async def get_dataset(self, request: web.Request) -> web.Response:
+        return web.json_response({"data": {"id": request.match_info["dataset_id"], "itemCount": len(self.items)}})
+
+    async def get_items(self, request: web.Request) -> web.Response:
+        offset = int(request.query["offset"])
+        limit = int(request.query["limit"])
+        self.page_offsets.append(offset)
+        return self.jsonl(self.items[offset:offset + limit])
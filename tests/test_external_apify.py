@@ -0,0 +1,58 @@
+import asyncio
+import json
+import unittest
+
+from app.repositories.external import AdaptiveLimiter, ApifyClient, ExternalRepository
+from tests.fake_apify import FakeApify
+
+ITEMS = [{"id": str(i), "playCount": i} for i in range(5)]
+
+
+class ApifyRunTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # The shared limiter is bound to the loop that first waits on it
+        self.limiter = ApifyClient.limiter
+        ApifyClient.limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=4, latency_tolerance=2)
+
+    async def asyncTearDown(self):
+        await ApifyClient.close()
+        ApifyClient.limiter = self.limiter
+
+    def repository(self, fake: FakeApify, run_mode: str = "async") -> ExternalRepository:
+        repository = ExternalRepository()
+        repository.apify_url = fake.url
+        repository.apify_token = "token"
+        repository.run_mode = run_mode
+        repository.run_poll_interval = 0
+        repository.dataset_page_size = 2
+        return repository
+
+    async def stream(self, repository: ExternalRepository) -> list[dict]:
+        return [json.loads(line) async for line in repository._stream_actor_lines("actor", {})]
+
+    async def test_async_run_is_polled_then_downloaded_in_pages(self):
+        async with FakeApify(ITEMS) as fake:
+            self.assertEqual(await self.stream(self.repository(fake)), ITEMS)
+        self.assertEqual(fake.polls, 2)
+        self.assertEqual(sorted(fake.page_offsets), [0, 2, 4])
+
+    async def test_failed_run_raises(self):
+        async with FakeApify(ITEMS, statuses=("FAILED",)) as fake:
+            with self.assertRaises(RuntimeError):
+                await self.stream(self.repository(fake))
+        self.assertEqual(fake.page_offsets, [])
+
+    async def test_cancelled_run_is_aborted(self):
+        async with FakeApify(ITEMS, hang=True) as fake:
+            task = asyncio.create_task(self.stream(self.repository(fake)))
+            await fake.polled.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertEqual(fake.aborted, ["run-1"])
+        self.assertEqual(ApifyClient.limiter.in_flight, 0)
+
+    async def test_sync_run_streams_items(self):
+        async with FakeApify(ITEMS) as fake:
+            self.assertEqual(await self.stream(self.repository(fake, run_mode="sync")), ITEMS)
+        self.assertEqual(fake.polls, 0)
@@ -0,0 +1,71 @@
+import json
+import unittest
+
+from app.repositories.external import ExternalRepository
+from app.schemas.external import ExternalVideoDataSchema
+
+
+def legacy_parse(row: dict) -> dict:
+    # The per-row path ExternalVideoStatsRow replaced, projected onto its fields
+    if row.get("error") is None:
+        schema = ExternalVideoDataSchema.model_validate(dict(row))
+    else:
+        schema = ExternalVideoDataSchema(
+            error=row.get("error"),
+            authorMeta=ExternalVideoDataSchema.AuthorMeta(name=row.get("input", ""), avatar=""),
+        )
+    author = schema.authorMeta
+    return {
+        "video_id": schema.id,
+        "views": schema.playCount,
+        "comments": schema.commentCount,
+        "diggs": schema.diggCount,
+        "shares": schema.shareCount,
+        "cover_url": schema.videoMeta.originalCoverUrl if schema.videoMeta is not None else None,
+        "video_url": schema.mediaUrls[0] if schema.mediaUrls else "",
+        "nickname": author.name if author is not None else "",
+        "avatar": author.avatar if author is not None else "",
+        "followers": author.fans if author is not None else 0,
+        "following": author.following if author is not None else 0,
+        "likes": author.heart if author is not None else 0,
+        "user_diggs": author.digg if author is not None else 0,
+        "error": schema.error,
+    }
+
+
+ITEM = {
+    "id": "7000000000000000001",
+    "playCount": 100,
+    "commentCount": 2,
+    "diggCount": 10,
+    "shareCount": 1,
+    "mediaUrls": ["https://example.com/video.mp4"],
+    "videoMeta": {"originalCoverUrl": "https://example.com/cover.jpeg"},
+    "authorMeta": {"name": "user", "avatar": "https://example.com/avatar.jpeg", "fans": 5, "heart": 7, "digg": 3},
+}
+
+
+class DecodeVideoRowsTest(unittest.TestCase):
+    def assert_same(self, items: list[dict]):
+        for separators in [(", ", ": "), (",", ":")]:
+            lines = [json.dumps(item, separators=separators).encode() for item in items]
+            rows = ExternalRepository._decode_video_rows(lines)
+            self.assertEqual([row.model_dump() for row in rows], [legacy_parse(item) for item in items])
+
+    def test_plain_keys(self):
+        self.assert_same([ITEM])
+
+    def test_padded_top_level_keys(self):
+        self.assert_same([
+            {f" {key}" if i % 2 else f"{key}   ": value for i, (key, value) in enumerate(ITEM.items())},
+            {f"  {key}  ": value for key, value in ITEM.items()},
+        ])
+
+    def test_padded_and_plain_key_last_one_wins(self):
+        self.assert_same([ITEM | {" playCount": 200}, {" playCount": 200} | ITEM])
+
+    def test_error_items(self):
+        self.assert_same([{"error": "Profile not found", "input": "missing"}])
+
+    def test_padded_pattern_inside_values(self):
+        self.assert_same([ITEM | {"mediaUrls": ['{" a ":1, " b" :2}']}])
@@ -0,0 +1,25 @@
+import asyncio
+import unittest
+
+from app.repositories.external import AdaptiveLimiter
+
+
+class AdaptiveLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def burst(self, limiter: AdaptiveLimiter, size: int):
+        async def call():
+            async with limiter.slot():
+                await asyncio.sleep(0.01)
+                raise TimeoutError
+
+        await asyncio.gather(*[call() for _ in range(size)], return_exceptions=True)
+
+    async def test_burst_of_failures_decreases_once(self):
+        limiter = AdaptiveLimiter(initial=16, minimum=1, maximum=32, latency_tolerance=2)
+        await self.burst(limiter, 8)
+        self.assertEqual(limiter.limit, 8)
+
+    async def test_each_congestion_event_decreases(self):
+        limiter = AdaptiveLimiter(initial=16, minimum=1, maximum=32, latency_tolerance=2)
+        await self.burst(limiter, 8)
+        await self.burst(limiter, 8)
+        self.assertEqual(limiter.limit, 4)
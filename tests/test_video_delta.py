@@ -0,0 +1,36 @@
+import time
+import unittest
+
+from app.repositories.video_delta import VideoDeltaRepository, VideoDeltaSettings
+
+
+def row(video_id: str, views: int = 1) -> dict:
+    return {"video_id": video_id, "views": views, "comments": 0, "diggs": 0, "shares": 0}
+
+
+class MemoryVideoDeltaTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.repository = VideoDeltaRepository()
+        self.repository.redis = None
+        self.repository.settings = VideoDeltaSettings(video_delta_store="memory", video_delta_memory_size=2)
+        self.repository.memory = {}
+
+    async def test_unchanged_rows_are_skipped(self):
+        await self.repository.remember([row("1")])
+        self.assertEqual(await self.repository.filter_changed([row("1"), row("1", views=2)]), [row("1", views=2)])
+
+    async def test_least_recently_stored_are_dropped(self):
+        await self.repository.remember([row("1"), row("2")])
+        await self.repository.remember([row("1", views=2)])
+        await self.repository.remember([row("3")])
+        self.assertEqual(list(self.repository.memory), ["1", "3"])
+
+    async def test_expired_are_dropped(self):
+        self.repository.memory["1"] = f"1:0:0:0@{int(time.time()) - 8 * 86400}"
+        await self.repository.remember([row("2")])
+        self.assertEqual(list(self.repository.memory), ["2"])
+
+    async def test_forgotten_rows_are_stored_again(self):
+        await self.repository.remember([row("1")])
+        await self.repository.forget(["1"])
+        self.assertEqual(await self.repository.filter_changed([row("1")]), [row("1")])
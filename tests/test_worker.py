@@ -0,0 +1,51 @@
+"""Needs a scratch Redis database:
+
+    TEST_REDIS_URL=redis://localhost:6379/15 python -m unittest
+"""
+import os
+import unittest
+import uuid
+
+from redis.asyncio import Redis
+
+from app.repositories.queue import Job, JobQueue, QueueSettings
+from app.worker import Worker
+
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL")
+
+
+class FailingWorker(Worker):
+    async def handle(self, job: Job):
+        raise RuntimeError("No profile of 1 was scraped")
+
+
+@unittest.skipUnless(TEST_REDIS_URL, "TEST_REDIS_URL is not set")
+class WorkerRetryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = Redis.from_url(TEST_REDIS_URL, decode_responses=True)
+        settings = QueueSettings(
+            queue_name=f"test-{uuid.uuid4().hex}",
+            queue_max_attempts=3,
+            queue_backoff_seconds=0,
+        )
+        self.queue = JobQueue(settings=settings, redis=self.redis)
+        self.worker = FailingWorker(queue=self.queue)
+
+    async def asyncTearDown(self):
+        keys = await self.redis.keys(f"queue:{self.queue.settings.queue_name}:*")
+        if keys:
+            await self.redis.delete(*keys)
+        await self.redis.aclose()
+
+    async def test_failing_job_is_retried_then_dead_lettered(self):
+        await self.queue.enqueue("profiles", {"nicknames": ["user"]})
+        attempts = 0
+        while (job := await self.queue.reserve()) is not None:
+            attempts += 1
+            self.assertEqual(job.attempts, attempts)
+            await self.worker.process(job)
+        self.assertEqual(attempts, 3)
+        self.assertEqual(await self.queue.size(), 0)
+        dead = await self.redis.lrange(self.queue._dead_key, 0, -1)
+        self.assertEqual(len(dead), 1)
+        self.assertIn("No profile of 1 was scraped", dead[0])